@@ -0,0 +1,356 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import downloader
+import manifest
+import network
+import playlist_cache
+import postprocess
+import progress
+import streams
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BLOCK_SIZE = 1024 * 1024
+WRITE_SIZE = 64 * 1024
+ITAG = 22
+RESOLUTION = "720p"
+
+
+class FakeYouTube(ThreadingHTTPServer):
+    # A local stand-in for YouTube: playlist listings, watch pages with stream
+    # manifests and ranged media bodies, with tunable latency, per-connection
+    # bandwidth and injected failures
+    daemon_threads = True
+
+    def __init__(self, items, size, latency=0.0, rate=None, fail_rate=0.0, drop_rate=0.0, media=None):
+        super().__init__(("127.0.0.1", 0), FakeYouTubeHandler)
+        self.items = items
+        self.latency = latency
+        self.rate = rate
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.media = media
+        self.size = len(media) if media is not None else size
+        # Synthetic bodies repeat one random block so large sizes cost no memory
+        self.block = os.urandom(BLOCK_SIZE)
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def video_ids(self):
+        return [f"bench{i:05d}" for i in range(self.items)]
+
+    def body(self, start, end):
+        if self.media is not None:
+            return self.media[start:end]
+        out = bytearray()
+        while start < end:
+            offset = start % BLOCK_SIZE
+            piece = self.block[offset:min(BLOCK_SIZE, offset + end - start)]
+            out += piece
+            start += len(piece)
+        return bytes(out)
+
+    def count(self, failed=False):
+        with self.lock:
+            self.requests += 1
+            self.failures += failed
+
+
+class FakeYouTubeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if server.latency:
+            time.sleep(server.latency)
+
+        if parts.path == "/playlist":
+            server.count()
+            self.send_json([f"https://www.youtube.com/watch?v={vid}" for vid in server.video_ids()])
+        elif parts.path == "/watch":
+            server.count()
+            vid = query["v"][0]
+            self.send_json({
+                "title": f"Benchmark {vid}",
+                "streams": [{"itag": ITAG, "resolution": RESOLUTION, "filesize": server.size,
+                             "url": f"{server.url}/media/{vid}"}],
+            })
+        elif parts.path.startswith("/media/"):
+            self.send_media()
+        else:
+            server.count(failed=True)
+            self.send_error(404)
+
+    def send_media(self):
+        server = self.server
+        if random.random() < server.fail_rate:
+            server.count(failed=True)
+            self.send_error(503)
+            return
+        start, end = 0, server.size - 1
+        ranged = self.headers.get("Range", "").startswith("bytes=")
+        if ranged:
+            first, _, last = self.headers["Range"][6:].partition("-")
+            start, end = int(first), min(int(last) if last else end, end)
+        length = end - start + 1
+        self.send_response(206 if ranged else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(length))
+        if ranged:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{server.size}")
+        self.end_headers()
+
+        # A dropped connection stops halfway through the body, which the client must resume
+        drop_at = start + length // 2 if random.random() < server.drop_rate else None
+        server.count(failed=drop_at is not None)
+        offset = start
+        while offset <= end:
+            chunk_end = min(offset + WRITE_SIZE, end + 1, drop_at or end + 1)
+            if chunk_end <= offset:
+                self.close_connection = True
+                return
+            self.wfile.write(server.body(offset, chunk_end))
+            if server.rate:
+                time.sleep((chunk_end - offset) / server.rate)
+            offset = chunk_end
+
+
+class SyntheticStream:
+    def __init__(self, title, info):
+        self.itag = info["itag"]
+        self.resolution = info["resolution"]
+        self.filesize = info["filesize"]
+        self.url = info["url"]
+        self.default_filename = f"{title}.mp4"
+        self.subtype = "mp4"
+        self.is_progressive = True
+        self.is_adaptive = False
+        self.includes_video_track = True
+        self.includes_audio_track = True
+
+
+class SyntheticVideo:
+    def __init__(self, info):
+        self.title = info["title"]
+        self.streams = streams.StreamList(SyntheticStream(self.title, s) for s in info["streams"])
+
+
+class TimingTracker(progress.ProgressTracker):
+    # Records time to first byte for every stream the engine starts
+    def __init__(self):
+        super().__init__()
+        self.started = {}
+        self.first_byte = []
+
+    def start(self, key, total, written=0, item=None):
+        self.started[key] = time.monotonic()
+        super().start(key, total, written, item)
+
+    def advance(self, key, nbytes):
+        started = self.started.pop(key, None)
+        if started is not None:
+            self.first_byte.append(time.monotonic() - started)
+        super().advance(key, nbytes)
+
+
+class BenchmarkDownloader(downloader.PlaylistDownloader):
+    # The real engine with metadata resolved from the fake server instead of pytube
+    def __init__(self, server_url, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.server_url = server_url
+        self.tracker = TimingTracker()
+
+    def resolve_video(self, video_url, fresh=False):
+        with self.metrics.span("metadata", video_url):
+            with network.POOL.request(f"{self.server_url}/watch?v={manifest.video_id(video_url)}") as response:
+                yt = SyntheticVideo(json.loads(response.read()))
+        with self.metrics.span("select", video_url):
+            return yt, streams.select(yt.streams, self.quality_ladder)
+
+
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system, times.children_user + times.children_system
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        "min": round(values[0], 4),
+        "median": round(statistics.median(values), 4),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+        "max": round(values[-1], 4),
+    }
+
+
+def synthesize_media(seconds):
+    # A real 720p H.264/AAC clip, so post-processing has something to re-encode
+    path = os.path.join(tempfile.mkdtemp(prefix="wt_bench_media_"), "clip.mp4")
+    subprocess.run(
+        ["ffmpeg", "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
+         "-f", "lavfi", "-i", f"testsrc=duration={seconds}:size=1280x720:rate=30",
+         "-f", "lavfi", "-i", f"sine=duration={seconds}",
+         "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path],
+        check=True
+    )
+    with open(path, "rb") as f:
+        media = f.read()
+    shutil.rmtree(os.path.dirname(path))
+    return media
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the download engine against a local fake YouTube server.")
+    parser.add_argument("--items", type=int, default=50, help="videos in the synthetic playlist")
+    parser.add_argument("--size", type=network.parse_rate, default="20M", help="bytes per synthetic video, e.g. 20M")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before every server response")
+    parser.add_argument("--server-rate", type=network.parse_rate, default=None,
+                        help="bandwidth cap per server connection, e.g. 5M (bytes per second)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of media requests answered with 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of media responses cut off halfway")
+    parser.add_argument("-j", "--workers", type=int, default=4)
+    parser.add_argument("--metadata-workers", type=int, default=2)
+    parser.add_argument("--prefetch", type=int, default=8)
+    parser.add_argument("--limit-rate", type=network.parse_rate, default=None, help="client-side bandwidth cap")
+    parser.add_argument("--enhance", action="store_true",
+                        help="serve a real clip generated with ffmpeg and time post-processing as well")
+    parser.add_argument("--clip-seconds", type=int, default=10, help="length of the clip used with --enhance")
+    parser.add_argument("--transcode-workers", type=int, default=None)
+    parser.add_argument("--keep", action="store_true", help="keep the downloaded files")
+    return parser.parse_args(argv)
+
+
+def run_downloads(server, args, save_path):
+    playlist_url = f"{server.url}/playlist?list=BENCH"
+    enumerate_start = time.monotonic()
+    with network.POOL.request(playlist_url) as response:
+        playlist_cache.store(save_path, playlist_url, json.loads(response.read()))
+    enumerate_seconds = time.monotonic() - enumerate_start
+
+    retries = []
+    engine = BenchmarkDownloader(
+        server.url, playlist_url, RESOLUTION, save_path,
+        max_workers=args.workers,
+        metadata_workers=args.metadata_workers,
+        prefetch_depth=args.prefetch,
+        reuse_copies=False,
+        on_log=lambda message: retries.append(message) if message.startswith("Retrying") else None,
+    )
+    cpu_before, _ = cpu_seconds()
+    start = time.monotonic()
+    engine.run()
+    elapsed = time.monotonic() - start
+    cpu_after, _ = cpu_seconds()
+
+    completed = len(engine.done) - len(engine.failed)
+    transferred = engine.tracker.bytes_done
+    return {
+        "items": completed,
+        "failed": len(engine.failed),
+        "retries": len(retries),
+        "seconds": round(elapsed, 3),
+        "enumerate_seconds": round(enumerate_seconds, 3),
+        "items_per_second": round(completed / elapsed, 3) if elapsed else None,
+        "mb_per_second": round(transferred / elapsed / (1024 * 1024), 2) if elapsed else None,
+        "bytes": transferred,
+        "ttfb_seconds": percentiles(engine.tracker.first_byte),
+        "cpu_seconds": round(cpu_after - cpu_before, 3),
+        "server_requests": server.requests,
+        "server_failures": server.failures,
+        "phases": engine.metrics.summary()["phases"],
+    }
+
+
+def run_postprocessing(save_path, workers):
+    paths = [os.path.join(save_path, name) for name in sorted(os.listdir(save_path)) if name.endswith(".mp4")]
+    actions = []
+    _, children_before = cpu_seconds()
+    start = time.monotonic()
+    pool = postprocess.TranscodePool(workers, on_done=lambda path, action, error: actions.append(error or action))
+    for path in paths:
+        pool.submit(path)
+    pool.shutdown()
+    elapsed = time.monotonic() - start
+    _, children_after = cpu_seconds()
+    errors = [a for a in actions if isinstance(a, Exception)]
+    return {
+        "items": len(paths) - len(errors),
+        "failed": len(errors),
+        "workers": pool.size,
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(len(paths) / elapsed, 3) if elapsed else None,
+        "ffmpeg_cpu_seconds": round(children_after - children_before, 3),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    network.LIMITER.set_rate(args.limit_rate)
+    media = synthesize_media(args.clip_seconds) if args.enhance else None
+    server = FakeYouTube(args.items, args.size, args.latency, args.server_rate, args.fail_rate, args.drop_rate, media)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    save_path = tempfile.mkdtemp(prefix="wt_bench_")
+    try:
+        summary = {
+            "config": {key: value for key, value in vars(args).items() if key != "keep"},
+            "download": run_downloads(server, args, save_path),
+        }
+        if args.enhance:
+            summary["postprocess"] = run_postprocessing(save_path, args.transcode_workers)
+        summary["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        server.shutdown()
+        network.POOL.close()
+        if args.keep:
+            print(f"Files kept in {save_path}", file=sys.stderr)
+        else:
+            shutil.rmtree(save_path, ignore_errors=True)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import diskspace
+import downloader
+import metadata_cache
+import metrics
+import network
+import playlist_cache
+import streams
+
+
+def emit(event, **fields):
+    # One JSON object per line so batch jobs can parse progress from stdout
+    sys.stdout.write(json.dumps(dict(fields, event=event, time=time.time())) + "\n")
+    sys.stdout.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download YouTube playlists without the GUI.")
+    parser.add_argument("urls", nargs="+", help="playlist URLs to download")
+    parser.add_argument("-q", "--quality", default="1080p", choices=streams.QUALITY_LADDER + [streams.AUDIO_ONLY])
+    parser.add_argument("--audio-format", default=streams.AUDIO_FORMATS[0], choices=streams.AUDIO_FORMATS,
+                        help="file format for -q audio; m4a and opus avoid re-encoding when the source allows")
+    parser.add_argument("--audio-workers", type=int, default=None,
+                        help="parallel audio conversions for -q audio, defaults to the CPU count")
+    parser.add_argument("-o", "--output", default=".", help="folder to save videos to")
+    parser.add_argument("-j", "--workers", type=int, default=4, help="parallel downloads")
+    parser.add_argument("--metadata-workers", type=int, default=2)
+    parser.add_argument("--prefetch", type=int, default=8, help="resolved entries kept ahead of the downloaders")
+    parser.add_argument("--no-fallback", action="store_true", help="skip videos not available at --quality")
+    parser.add_argument("--sync", action="store_true", help="only download videos that are new or changed")
+    parser.add_argument("--prune", action="store_true", help="remove videos that are no longer in the playlist")
+    parser.add_argument("--no-reuse", action="store_true",
+                        help="always download, even if another folder already has the same video and stream")
+    parser.add_argument("--playlist-ttl", type=int, default=playlist_cache.DEFAULT_TTL,
+                        help="seconds to reuse a cached playlist listing, 0 to always list it again (ignored with --sync/--prune)")
+    parser.add_argument("--metadata-ttl", type=int, default=metadata_cache.DEFAULT_TTL,
+                        help="seconds to reuse cached video metadata, 0 to always fetch it")
+    parser.add_argument("--max-attempts", type=int, default=4, help="tries per video for retryable errors")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="only re-run videos that failed with retryable errors last time")
+    parser.add_argument("--limit-rate", type=network.parse_rate, default=None,
+                        help="bandwidth cap shared by all downloads, e.g. 2M (bytes per second)")
+    parser.add_argument("--schedule", type=network.BandwidthSchedule.parse, default=None,
+                        help="time-of-day caps, e.g. 09:00-18:00=2M,22:00-07:00=0")
+    parser.add_argument("--min-free", type=network.parse_rate, default=diskspace.MIN_FREE,
+                        help="free space to keep on the output disk, e.g. 5G; downloads wait below it (0 to use it all)")
+    parser.add_argument("--enhance", action="store_true", help="post-process downloads with ffmpeg like the GUI")
+    parser.add_argument("--stream-enhance", action="store_true",
+                        help="re-encode videos below 1080p H.264 while they download, without storing the original")
+    parser.add_argument("--transcode-workers", type=int, default=None, help="defaults to the CPU count")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics while running")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record a cProfile of the worker threads to {metrics.PROFILE_NAME} in the output folder")
+    return parser.parse_args(argv)
+
+
+def run_playlist(playlist_url, args, transcode_pool):
+    result = {"finished": False}
+
+    def finished():
+        result["finished"] = True
+        emit("finished", playlist=playlist_url, failed=[
+            {"url": url, "kind": kind, "error": error} for url, kind, error in engine.failed
+        ])
+
+    def downloaded(path):
+        emit("video_downloaded", playlist=playlist_url, path=path)
+        if transcode_pool and args.quality != streams.AUDIO_ONLY:
+            transcode_pool.submit(path, engine.metrics)
+
+    engine = downloader.PlaylistDownloader(
+        playlist_url, args.quality, args.output,
+        max_workers=args.workers,
+        metadata_workers=args.metadata_workers,
+        prefetch_depth=args.prefetch,
+        fallback=not args.no_fallback,
+        sync=args.sync,
+        prune=args.prune,
+        reuse_copies=not args.no_reuse,
+        stream_encode=args.stream_enhance,
+        audio_format=args.audio_format,
+        audio_workers=args.audio_workers,
+        metadata_ttl=args.metadata_ttl,
+        playlist_ttl=args.playlist_ttl,
+        max_attempts=args.max_attempts,
+        retry_failed=args.retry_failed,
+        profile=args.profile,
+        min_free_space=args.min_free,
+        on_log=lambda message: emit("log", playlist=playlist_url, message=message),
+        on_stats=lambda stats: emit("progress", playlist=playlist_url, **stats),
+        on_videos_found=lambda count: emit("videos_found", playlist=playlist_url, count=count),
+        on_video_downloaded=downloaded,
+        on_resume=lambda index: emit("stopped", playlist=playlist_url, resume_index=index),
+        on_finished=finished,
+        on_error=lambda message: emit("error", playlist=playlist_url, message=message),
+    )
+
+    # Run the engine off the main thread so Ctrl+C can stop it cleanly and leave resumable state behind
+    worker = threading.Thread(target=engine.run)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        engine.stop()
+        worker.join()
+        raise
+    return result["finished"] and not engine.failed
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+    network.LIMITER.set_rate(args.limit_rate)
+    network.LIMITER.set_schedule(args.schedule)
+    metrics_server = metrics.serve(args.metrics_port) if args.metrics_port else None
+
+    transcode_pool = None
+    if args.enhance:
+        import manifest
+        import postprocess
+
+        def enhanced(path, action, error):
+            if not error and action != postprocess.SKIP:
+                try:
+                    manifest.refresh_file(path)
+                except Exception as e:
+                    error = e
+            emit("enhanced", path=path, action=action, error=str(error) if error else None)
+
+        transcode_pool = postprocess.TranscodePool(args.transcode_workers, on_done=enhanced, min_free=args.min_free,
+                                                   on_log=lambda message: emit("log", message=message))
+
+    failed = 0
+    try:
+        for playlist_url in args.urls:
+            if not run_playlist(playlist_url, args, transcode_pool):
+                failed += 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if transcode_pool:
+            transcode_pool.shutdown()
+        if metrics_server:
+            metrics_server.shutdown()
+    summary = metrics.REGISTRY.summary()
+    emit("metrics", counters=summary["counters"], phases=summary["phases"], seconds=summary["seconds"])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import errno
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+STORE_PATH = os.path.join(os.path.expanduser("~"), ".wt_playlist_downloader", "store.sqlite3")
+# ioctl that makes dst share src's extents on copy-on-write filesystems (btrfs, xfs)
+FICLONE = 0x40049409
+
+LINKED = "hardlink"
+REFLINKED = "reflink"
+COPIED = "copy"
+
+
+def reflink(src, dst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink is not supported on this platform")
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+
+def place(src, dst):
+    # Cheapest way to make dst a copy of src: a hardlink on the same filesystem,
+    # a reflink across subvolumes, a plain copy otherwise. dst appears atomically.
+    tmp = dst + ".link"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+        method = LINKED
+    except OSError:
+        try:
+            reflink(src, tmp)
+            method = REFLINKED
+        except OSError as e:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if e.errno not in (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EPERM):
+                raise
+            shutil.copyfile(src, tmp)
+            method = COPIED
+    os.replace(tmp, dst)
+    return method
+
+
+class ContentStore:
+    # Every downloaded file on this machine, keyed by video id and stream itag, so a
+    # video that several playlists share is fetched once. A file only counts while its
+    # size and mtime match what was recorded: post-processing replaces files, and an
+    # enhanced copy is no longer the stream it was downloaded as.
+    def __init__(self, path=STORE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS copies (
+                video_id TEXT NOT NULL,
+                itag INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                added REAL,
+                PRIMARY KEY (video_id, itag, path)
+            )
+        """)
+        self.conn.commit()
+
+    def add(self, vid, itag, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO copies (video_id, itag, path, size, mtime_ns, added) VALUES (?, ?, ?, ?, ?, ?)",
+                (vid, itag, path, stat.st_size, stat.st_mtime_ns, time.time())
+            )
+            self.conn.commit()
+
+    def find(self, vid, itag):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, size, mtime_ns FROM copies WHERE video_id = ? AND itag = ? ORDER BY added DESC",
+                (vid, itag)
+            ).fetchall()
+        stale = []
+        found = None
+        for path, size, mtime_ns in rows:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stale.append(path)
+                continue
+            if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                stale.append(path)
+            else:
+                found = path
+                break
+        if stale:
+            with self.lock:
+                self.conn.executemany(
+                    "DELETE FROM copies WHERE video_id = ? AND itag = ? AND path = ?",
+                    [(vid, itag, path) for path in stale]
+                )
+                self.conn.commit()
+        return found
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
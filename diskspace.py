@@ -0,0 +1,68 @@
+import contextlib
+import os
+import shutil
+import threading
+
+MIN_FREE = 1024 * 1024 * 1024
+POLL_INTERVAL = 5.0
+
+
+def format_size(nbytes):
+    return f"{nbytes / (1024 * 1024):.0f} MB"
+
+
+class DiskSpace:
+    # Admission control for one filesystem. Every item reserves the space it will need
+    # before it starts, and waits while free space minus what running items have
+    # reserved would drop below min_free. Reservations are counted in full until the
+    # item ends, even once its file is preallocated, which errs on the safe side.
+    def __init__(self, path):
+        self.path = path
+        self.reserved = 0
+        self.condition = threading.Condition()
+
+    def free(self):
+        return shutil.disk_usage(self.path).free
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes, min_free=MIN_FREE, check=None, on_wait=None):
+        waited = False
+        with self.condition:
+            while self.free() - self.reserved - nbytes < min_free:
+                if not waited and on_wait:
+                    on_wait(f"Waiting for disk space: need {format_size(nbytes)}, "
+                            f"{format_size(self.free())} free, keeping {format_size(min_free)} spare")
+                waited = True
+                # Other items finishing wake this up early; freed space is noticed on the next poll
+                self.condition.wait(POLL_INTERVAL)
+                if check:
+                    check()
+            self.reserved += nbytes
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.reserved -= nbytes
+                self.condition.notify_all()
+
+
+_filesystems = {}
+_lock = threading.Lock()
+
+
+def for_path(path):
+    # One controller per filesystem, shared by every download and job in the process
+    device = os.stat(path).st_dev
+    with _lock:
+        if device not in _filesystems:
+            _filesystems[device] = DiskSpace(path)
+        return _filesystems[device]
+
+
+def wake_waiters():
+    # Lets items waiting for space re-run their check right away, e.g. after a stop
+    with _lock:
+        filesystems = list(_filesystems.values())
+    for filesystem in filesystems:
+        with filesystem.condition:
+            filesystem.condition.notify_all()
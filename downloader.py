@@ -0,0 +1,605 @@
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import dedup
+import diskspace
+import journal
+import manifest
+import metadata_cache
+import metrics
+import network
+import playlist_cache
+import postprocess
+import progress
+import resumable
+import retry
+import streams
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class NoStreamFound(Exception):
+    pass
+
+
+def ignore(*args):
+    pass
+
+
+# Output paths (without extension) in use by downloads in this process, with the video
+# id downloading to each, so engines running side by side never share a .part file
+_claimed_paths = {}
+_claims_lock = threading.Lock()
+
+
+def claim_key(path):
+    return os.path.splitext(os.path.abspath(path))[0]
+
+
+class PlaylistDownloader:
+    # The download engine shared by the Qt GUI and the command line. It reports
+    # through plain callbacks so it can run without PyQt5.
+    def __init__(self, playlist_url, quality, save_path, start_index=0, max_workers=4,
+                 metadata_workers=2, prefetch_depth=8, fallback=True, sync=False, prune=False,
+                 playlist_ttl=playlist_cache.DEFAULT_TTL, slots=None, slot_key=None, priority=0,
+                 max_attempts=4, retry_budget=100, retry_failed=False, reuse_copies=True, stream_encode=False,
+                 audio_format=streams.AUDIO_FORMATS[0], audio_workers=None,
+                 metadata_ttl=metadata_cache.DEFAULT_TTL, only_urls=None, exclude_urls=(), profile=False,
+                 min_free_space=diskspace.MIN_FREE,
+                 on_log=ignore, on_progress=ignore, on_stats=ignore, on_videos_found=ignore, on_video_downloaded=ignore,
+                 on_resume=ignore, on_finished=ignore, on_error=ignore):
+        self.playlist_url = playlist_url
+        self.quality = quality
+        self.quality_ladder = streams.fallback_ladder(quality, fallback)
+        self.save_path = save_path
+        self.start_index = start_index
+        self.max_workers = max(1, max_workers)
+        self.metadata_workers = max(1, metadata_workers)
+        self.prefetch_depth = max(1, prefetch_depth)
+        self.sync = sync
+        self.prune = prune
+        self.playlist_ttl = playlist_ttl
+        self.slots = slots
+        self.slot_key = slot_key if slot_key is not None else playlist_url
+        self.priority = priority
+        self.max_attempts = max(1, max_attempts)
+        self.retry_budget = retry.RetryBudget(retry_budget)
+        self.retry_failed = retry_failed
+        self.failed = []
+        self.downloaders_alive = 0
+        self.listing_error = None
+        self.reuse_copies = reuse_copies
+        self.stream_encode = stream_encode
+        self.audio_format = audio_format
+        self.audio_workers = max(1, audio_workers or os.cpu_count() or 1)
+        self.encoders = None
+        self.metadata_ttl = metadata_ttl
+        self.metadata_cache = None
+        self.only_urls = set(only_urls) if only_urls is not None else None
+        self.exclude_urls = set(exclude_urls or ())
+        self.content_store = None
+        self.min_free_space = min_free_space or 0
+        self.disk_space = None
+        self.metrics = metrics.Metrics(parent=metrics.REGISTRY)
+        self.profiler = metrics.Profiler() if profile else None
+        self.total_videos = 0
+        self.done = set()
+        self.tracker = progress.ProgressTracker()
+        self.entries_lock = threading.Lock()
+        # Pulling the next entry can page the playlist over the network; it gets its own lock
+        # so finishing downloads never wait on a continuation page
+        self.listing_lock = threading.Lock()
+        self.journal = None
+        self.manifest = None
+        self._is_running = True
+        self.on_log = on_log
+        self.on_progress = on_progress
+        self.on_stats = on_stats
+        self.on_videos_found = on_videos_found
+        self.on_video_downloaded = on_video_downloaded
+        self.on_resume = on_resume
+        self.on_finished = on_finished
+        self.on_error = on_error
+
+    def stop(self):
+        self._is_running = False
+        diskspace.wake_waiters()
+
+    def check_running(self, *args):
+        # Also called for every downloaded chunk so a stop aborts mid-file
+        if not self._is_running:
+            raise DownloadCancelled()
+
+    def acquire_slot(self):
+        # Slots are shared with other jobs by the scheduler; give up as soon as stop() is called
+        while not self.slots.acquire(self.slot_key, self.priority, timeout=0.2):
+            self.check_running()
+
+    def resolve_video(self, video_url, fresh=False):
+        # Cached metadata is only used while its stream URLs are still signed; fresh skips it,
+        # e.g. when retrying after the host rejected a URL
+        vid = manifest.video_id(video_url)
+        with self.metrics.span("metadata", video_url):
+            yt = None
+            if self.metadata_cache and not fresh:
+                yt = self.metadata_cache.get(vid, video_url, need_urls=True)
+            cached = yt is not None
+            if cached:
+                self.metrics.add("metadata_cache_hits")
+            else:
+                from pytube import YouTube
+                yt = YouTube(video_url)
+            available = yt.streams
+        with self.metrics.span("select", video_url):
+            selection = streams.select(available, self.quality_ladder, self.audio_format)
+            if selection:
+                selection.filesize  # Resolve sizes here so the download stage never waits on HEAD requests
+        if self.metadata_cache and not cached:
+            try:
+                self.metadata_cache.put(vid, yt, available)
+            except Exception as e:
+                self.on_log(f"Could not cache metadata for {video_url}: {e}")
+        return yt, selection
+
+    def forget_metadata(self, video_url):
+        try:
+            self.metadata_cache.invalidate(manifest.video_id(video_url))
+        except Exception as e:
+            self.on_log(f"Could not drop cached metadata for {video_url}: {e}")
+
+    def report_progress(self, force=False):
+        # Chunk callbacks arrive thousands of times a second; only a few snapshots a second reach the UI
+        if force or self.tracker.should_report():
+            snapshot = self.tracker.snapshot(len(self.done), self.total_videos)
+            self.on_progress(snapshot["percent"])
+            self.on_stats(snapshot)
+
+    def fetch_stream(self, video_url, stream, output_path, title):
+        # Bytes go to a .part file first so an interrupted download continues where it stopped
+        vid = manifest.video_id(video_url)
+        offset = resumable.resume_offset(output_path, stream.filesize, stream.itag, vid)
+        if offset:
+            self.on_log(f"Resuming partial download: {title}")
+        key = (video_url, stream.itag)
+        self.tracker.start(key, stream.filesize, offset, video_url)
+
+        def on_chunk(chunk, bytes_remaining):
+            self.check_running()
+            self.tracker.advance(key, len(chunk))
+            self.metrics.add("bytes_downloaded", len(chunk))
+            self.report_progress()
+
+        # Transfer time includes the disk writes, which are also timed on their own
+        with self.metrics.span("transfer", video_url):
+            resumable.download(stream.url, output_path, stream.filesize, itag=stream.itag, video_id=vid,
+                               on_progress=on_chunk, check=self.check_running,
+                               span=lambda phase: self.metrics.span(phase, video_url))
+
+    def stream_video(self, video_url, stream, output_path, yt):
+        # The stream is encoded as it arrives; only the enhanced file is written
+        key = (video_url, stream.itag)
+        self.tracker.start(key, stream.filesize, 0, video_url)
+        encoder = postprocess.StreamingEncoder(output_path, getattr(yt, "length", 0) or 0)
+
+        def on_chunk(chunk, bytes_remaining):
+            self.check_running()
+            self.tracker.advance(key, len(chunk))
+            self.metrics.add("bytes_downloaded", len(chunk))
+            self.report_progress()
+
+        try:
+            # ffmpeg reads from a pipe, so a slow encode also slows the transfer
+            with self.metrics.span("transfer", video_url):
+                resumable.stream(stream.url, stream.filesize, encoder.write,
+                                 on_progress=on_chunk, check=self.check_running)
+            with self.metrics.span("enhance", video_url):
+                encoder.finish()
+        except BaseException:
+            encoder.abort()
+            raise
+        self.metrics.add("videos_stream_encoded")
+
+    def fetch_cover(self, yt, output_path):
+        # Best effort: a missing thumbnail only means no cover art
+        cover_path = os.path.splitext(output_path)[0] + ".cover.jpg"
+        try:
+            with network.POOL.request(yt.thumbnail_url) as response, open(cover_path, "wb") as f:
+                f.write(response.read())
+            return cover_path
+        except Exception:
+            resumable.remove_if_exists(cover_path)
+            return None
+
+    def convert_audio(self, video_url, yt, stream, source_path, output_path, index, held):
+        # Runs on the encoder pool, so the download worker is already fetching the next item.
+        # held carries the output path claim and the reserved disk space over from the download.
+        with held:
+            cover_path = self.fetch_cover(yt, output_path)
+            tags = {"title": yt.title, "artist": getattr(yt, "author", ""), "track": index + 1, "comment": video_url}
+            try:
+                with self.metrics.span("encode_audio", video_url):
+                    postprocess.extract_audio(source_path, output_path, self.audio_format, stream.audio_codec,
+                                              tags, cover_path, getattr(yt, "length", 0) or 0)
+                os.remove(source_path)
+            except Exception as e:
+                self.record_failure(video_url, e)
+                return
+            finally:
+                if cover_path:
+                    resumable.remove_if_exists(cover_path)
+        self.complete_video(video_url, yt, stream.itag, output_path)
+
+    def complete_video(self, video_url, yt, itag, output_path, reused=False):
+        self.journal.update(video_url, journal.DONE, bytes_written=os.path.getsize(output_path), output_path=output_path)
+        self.manifest.record(manifest.video_id(video_url), self.playlist_url, itag, output_path)
+        if not reused:
+            self.metrics.add("videos_downloaded")
+            self.on_log(f"Downloaded: {yt.title}")
+        self.on_video_downloaded(output_path)
+
+    def download_video(self, video_url, yt, selection, index=0):
+        if not selection:
+            raise NoStreamFound(f"No stream found for {yt.title} at {' / '.join(self.quality_ladder)}")
+        if selection.resolution != self.quality:
+            self.on_log(f"{self.quality} not available for {yt.title}, using {selection.resolution}")
+        self.check_running()
+        self.journal.update(video_url, journal.DOWNLOADING, itag=selection.video.itag)
+        vid, itag = manifest.video_id(video_url), selection.video.itag
+        audio_only = selection.resolution == streams.AUDIO_ONLY
+        filename = selection.video.default_filename
+        if audio_only:
+            # Claimed under the name the conversion writes, not the source stream's
+            filename = f"{os.path.splitext(filename)[0]}.{self.audio_format}"
+        streamed = False
+        with contextlib.ExitStack() as held:
+            output_path = self.claim_output_path(vid, filename)
+            held.callback(self.release_output_path, output_path)
+            source = self.content_store.find(vid, itag) if self.content_store and not audio_only else None
+            if source:
+                # Another playlist already has this exact stream; link it instead of downloading it again
+                if source != os.path.abspath(output_path):
+                    method = dedup.place(source, output_path)
+                    self.on_log(f"Reused existing copy ({method}): {yt.title}")
+                self.metrics.add("videos_reused")
+            else:
+                # Waits here while the disk is too full; the space stays reserved until the file is written
+                held.enter_context(self.disk_space.reserve(self.space_needed(selection), self.min_free_space,
+                                                           self.check_running, self.on_log))
+                if audio_only:
+                    self.fetch_audio(video_url, yt, selection, output_path, index, held)
+                    return
+                streamed = self.fetch_video(video_url, yt, selection, output_path)
+            # The store only holds streams exactly as YouTube served them
+            if self.content_store and not streamed:
+                self.content_store.add(vid, itag, output_path)
+            self.complete_video(video_url, yt, itag, output_path, reused=bool(source))
+
+    def claim_output_path(self, vid, filename):
+        # Titles are not unique. A name already used by another video, whether recorded in
+        # the folder manifest, downloading right now, or a file this app did not write,
+        # gets the video id appended.
+        path = os.path.join(self.save_path, filename)
+        owner = self.manifest.path_owner(path)
+        with _claims_lock:
+            claimant = _claimed_paths.get(claim_key(path))
+            if claimant not in (None, vid) or owner not in (None, vid) or (owner is None and os.path.exists(path)):
+                base, ext = os.path.splitext(path)
+                path = f"{base} [{vid}]{ext}"
+            _claimed_paths[claim_key(path)] = vid
+        return path
+
+    def release_output_path(self, path):
+        with _claims_lock:
+            _claimed_paths.pop(claim_key(path), None)
+
+    def space_needed(self, selection):
+        # Separate tracks sit next to the muxed file until it is written, and an audio
+        # source next to its conversion, so those need room for roughly twice the streams
+        if selection.adaptive or selection.resolution == streams.AUDIO_ONLY:
+            return selection.filesize * 2
+        if self.stream_encode and postprocess.needs_encode(selection.video):
+            return int(selection.filesize * postprocess.ENCODE_GROWTH)
+        return selection.filesize
+
+    def fetch_audio(self, video_url, yt, selection, output_path, index, held):
+        # Fetch the audio stream as is; conversion and tagging happen on the encoder pool,
+        # which takes over what is held only once the conversion is queued
+        source_path = f"{os.path.splitext(output_path)[0]}.source.{selection.video.subtype}"
+        self.fetch_stream(video_url, selection.video, source_path, yt.title)
+        handed_over = held.pop_all()
+        try:
+            self.encoders.submit(self.convert_audio, video_url, yt, selection.video, source_path, output_path, index,
+                                 handed_over)
+        except BaseException:
+            handed_over.close()
+            raise
+
+    def fetch_video(self, video_url, yt, selection, output_path):
+        # Returns whether the file was encoded on the way in
+        if selection.adaptive:
+            # Fetch both tracks at once, then stream-copy them into one file
+            base_path = os.path.splitext(output_path)[0]
+            video_path = base_path + ".video.mp4"
+            audio_path = base_path + ".audio.m4a"
+            # A track completed by an earlier attempt (e.g. before ffmpeg failed to start) is kept
+            pending = [(stream, path) for stream, path in ((selection.video, video_path), (selection.audio, audio_path))
+                       if not (os.path.exists(path) and os.path.getsize(path) == stream.filesize)]
+            with ThreadPoolExecutor(max_workers=2) as tracks:
+                futures = [tracks.submit(self.fetch_stream, video_url, stream, path, yt.title) for stream, path in pending]
+                for future in futures:
+                    future.result()
+            try:
+                with self.metrics.span("mux", video_url):
+                    postprocess.mux(video_path, audio_path, output_path)
+            except Exception as e:
+                # ffmpeg ran and rejected the tracks themselves, so they are of no use to a later
+                # attempt; when it could not start at all they are kept
+                if not isinstance(e, OSError):
+                    resumable.remove_if_exists(video_path)
+                    resumable.remove_if_exists(audio_path)
+                raise
+        elif self.stream_encode and postprocess.needs_encode(selection.video):
+            try:
+                self.stream_video(video_url, selection.video, output_path, yt)
+                return True
+            except postprocess.EncodeError as e:
+                # e.g. an mp4 whose index sits at the end cannot be decoded from a pipe
+                self.on_log(f"Streaming encode failed for {yt.title}, downloading first: {e}")
+                self.fetch_stream(video_url, selection.video, output_path, yt.title)
+        else:
+            self.fetch_stream(video_url, selection.video, output_path, yt.title)
+        return False
+
+    def put_resolved(self, resolved, item):
+        # Blocks while the prefetch queue is full, but gives up as soon as stop() is called
+        # or no downloader is left to empty it
+        while self._is_running and self.downloaders_alive:
+            try:
+                resolved.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def prefetch_metadata(self, entries, resolved):
+        while self._is_running:
+            with self.listing_lock, self.metrics.span("enumerate"):
+                entry = next(entries, None)
+            if entry is None:
+                return
+            index, video_url = entry
+            try:
+                yt, selection = self.resolve_video(video_url)
+                item = (index, video_url, yt, selection, None)
+            except Exception as e:
+                item = (index, video_url, None, None, e)
+            if not self.put_resolved(resolved, item):
+                return
+
+    def wait_or_stop(self, delay):
+        deadline = time.monotonic() + delay
+        while time.monotonic() < deadline:
+            self.check_running()
+            time.sleep(min(0.2, deadline - time.monotonic()))
+
+    def process_entry(self, video_url, yt, selection, error, index=0):
+        # Retryable failures back off and resolve the video again (fresh signed URLs);
+        # permanent ones and exhausted retries are raised to the caller
+        attempt = 1
+        while True:
+            try:
+                if error:
+                    raise error
+                if self.slots:
+                    self.acquire_slot()
+                try:
+                    self.download_video(video_url, yt, selection, index)
+                finally:
+                    if self.slots:
+                        self.slots.release(self.slot_key)
+                return attempt
+            except DownloadCancelled:
+                raise
+            except Exception as e:
+                e.attempts = attempt
+                if self.metadata_cache and getattr(e, "status", None) == 403:
+                    # The host rejected the cached signed URLs; later runs must not reuse them either
+                    self.forget_metadata(video_url)
+                if retry.classify(e) == retry.PERMANENT or attempt >= self.max_attempts or not self.retry_budget.take():
+                    raise
+                delay = retry.backoff(attempt)
+                self.metrics.add("retries")
+                self.on_log(f"Retrying {video_url} in {delay:.1f}s (attempt {attempt + 1}): {e}")
+                self.wait_or_stop(delay)
+            attempt += 1
+            error = None
+            try:
+                yt, selection = self.resolve_video(video_url, fresh=True)
+            except Exception as e:
+                error = e
+
+    def record_failure(self, video_url, error):
+        kind = retry.classify(error)
+        self.journal.update(video_url, journal.FAILED, attempts=getattr(error, "attempts", 1),
+                            error=str(error), error_kind=kind)
+        with self.entries_lock:
+            self.failed.append((video_url, kind, str(error)))
+        self.metrics.add(f"failures_{kind}")
+        self.on_log(f"Error: {video_url}: {error}")
+
+    def download_resolved(self, resolved, done):
+        try:
+            self.take_resolved(resolved, done)
+        finally:
+            with self.entries_lock:
+                self.downloaders_alive -= 1
+
+    def take_resolved(self, resolved, done):
+        while self._is_running:
+            try:
+                item = resolved.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+
+            index, video_url, yt, selection, error = item
+            try:
+                self.process_entry(video_url, yt, selection, error, index)
+            except DownloadCancelled:
+                self.journal.update(video_url, journal.PENDING)
+                self.tracker.finish(video_url)
+                continue
+            except Exception as e:
+                self.record_failure(video_url, e)
+            with self.entries_lock:
+                done.add(index)
+            self.tracker.finish(video_url)
+            self.report_progress(force=True)
+
+    def pending_entries(self, video_urls, finished, up_to_date, done, seen_ids):
+        # Entries before start_index, already marked done in the journal or, in sync mode,
+        # already in the folder manifest are counted as done and never resolved again.
+        # When re-running the retry queue, everything else counts as done. Videos left
+        # unticked in the preview are counted as done too.
+        retry_queue = self.journal.retryable_failures() if self.retry_failed else None
+        skipped = 0
+        excluded = 0
+        try:
+            for index, video_url in enumerate(video_urls):
+                self.total_videos = index + 1
+                if self.total_videos % 100 == 0:
+                    self.on_videos_found(self.total_videos)
+                video_id = manifest.video_id(video_url)
+                seen_ids.add(video_id)
+                self.journal.add_pending([(index, video_url)])
+                if video_url in self.exclude_urls or (self.only_urls is not None and video_url not in self.only_urls):
+                    with self.entries_lock:
+                        done.add(index)
+                    excluded += 1
+                elif (index < self.start_index or video_url in finished or video_id in up_to_date
+                        or (retry_queue is not None and video_url not in retry_queue)):
+                    with self.entries_lock:
+                        done.add(index)
+                    skipped += 1
+                else:
+                    yield index, video_url
+        except Exception as e:
+            # Keep whatever was listed so far; the videos already queued still download,
+            # but the run is reported as failed
+            self.listing_error = e
+            return
+        self.on_videos_found(self.total_videos)
+        self.enumerated = True
+        if skipped:
+            self.on_log(f"Skipped {skipped} already downloaded videos")
+        if excluded:
+            self.on_log(f"Skipped {excluded} videos not selected in the preview")
+
+    def run_worker(self, target, *args):
+        if self.profiler:
+            return self.profiler.run(target, *args)
+        return target(*args)
+
+    def write_metrics(self):
+        try:
+            self.metrics.write_summary(self.save_path)
+            if self.profiler:
+                self.on_log(f"Profile written to {self.profiler.dump(self.save_path)}")
+        except OSError as e:
+            self.on_log(f"Error writing metrics: {e}")
+
+    def open_stores(self):
+        os.makedirs(self.save_path, exist_ok=True)
+        self.journal = journal.DownloadJournal(self.save_path, self.playlist_url)
+        self.manifest = manifest.Manifest(self.save_path)
+        self.content_store = dedup.ContentStore() if self.reuse_copies else None
+        self.disk_space = diskspace.for_path(self.save_path)
+        self.metadata_cache = metadata_cache.MetadataCache(ttl=self.metadata_ttl) if self.metadata_ttl else None
+
+    def close_stores(self):
+        for store in (self.journal, self.manifest, self.content_store, self.metadata_cache):
+            if store:
+                store.close()
+
+    def run(self):
+        # A folder that cannot be created or a store that cannot be opened ends the run
+        # like any other error instead of escaping from the worker thread
+        try:
+            self.open_stores()
+        except (OSError, sqlite3.Error) as e:
+            self.close_stores()
+            self.on_error(f"Error: could not open {self.save_path}: {e}")
+            return
+        finished = self.journal.finished()
+        up_to_date = self.manifest.current_ids() if self.sync else set()
+        done = self.done
+        seen_ids = set()
+        self.enumerated = False
+        self.listing_error = None
+        self.downloaders_alive = self.max_workers
+
+        # Playlist pages are consumed lazily by the metadata workers, so the first downloads
+        # start while later pages are still loading
+        # Sync and prune compare the folder with the playlist as it is now, so they never use a cached listing
+        playlist_ttl = 0 if self.sync or self.prune else self.playlist_ttl
+        video_urls = playlist_cache.iter_video_urls(self.playlist_url, self.save_path, playlist_ttl)
+        entries = self.pending_entries(video_urls, finished, up_to_date, done, seen_ids)
+        resolved = queue.Queue(maxsize=self.prefetch_depth)
+        if self.quality == streams.AUDIO_ONLY:
+            self.encoders = ThreadPoolExecutor(max_workers=self.audio_workers)
+        with ThreadPoolExecutor(max_workers=self.metadata_workers + self.max_workers) as executor:
+            prefetchers = [executor.submit(self.run_worker, self.prefetch_metadata, entries, resolved)
+                           for _ in range(self.metadata_workers)]
+            downloaders = [executor.submit(self.run_worker, self.download_resolved, resolved, done)
+                           for _ in range(self.max_workers)]
+            wait(prefetchers)
+            for _ in downloaders:
+                self.put_resolved(resolved, None)
+        errors = []
+        for future in prefetchers + downloaders:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        # Videos sync skipped because another playlist already stored them belong to this one too
+        self.manifest.add_owners(seen_ids & up_to_date, self.playlist_url)
+        if self.encoders:
+            # Conversions already queued still finish, even after a stop
+            self.encoders.shutdown()
+        self.journal.close()
+        if self.content_store:
+            self.content_store.close()
+        if self.metadata_cache:
+            self.metadata_cache.close()
+        self.write_metrics()
+
+        if self.listing_error or errors:
+            self.manifest.close()
+            for e in errors:
+                self.on_log(f"Error: {e}")
+            if self.listing_error:
+                self.on_error(f"Error listing playlist: {self.listing_error}")
+            else:
+                self.on_error(f"Error: {len(errors)} worker threads stopped unexpectedly")
+            return
+        if not self._is_running:
+            self.manifest.close()
+            self.on_resume(next((i for i in range(self.total_videos) if i not in done), self.total_videos))
+            return
+        if self.prune and self.enumerated:
+            for path in self.manifest.prune(self.playlist_url, seen_ids):
+                self.on_log(f"Removed (no longer in playlist): {os.path.basename(path)}")
+        self.manifest.close()
+        if self.failed:
+            retryable = sum(1 for _, kind, _ in self.failed if kind == retry.RETRYABLE)
+            self.on_log(f"{len(self.failed)} videos failed ({retryable} can be retried later with Retry Failed)")
+        self.on_progress(100)
+        self.on_finished()
@@ -0,0 +1,232 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import downloader
+
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+STORE_PATH = os.path.join(os.path.expanduser("~"), ".wt_playlist_downloader", "jobs.sqlite3")
+
+
+class JobStore:
+    # Jobs survive restarts; anything that was running when the app went away is queued again
+    def __init__(self, path=STORE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                save_path TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                options TEXT NOT NULL DEFAULT '{}',
+                state TEXT NOT NULL,
+                created REAL
+            )
+        """)
+        self.conn.execute("UPDATE jobs SET state = ? WHERE state = ?", (QUEUED, RUNNING))
+        self.conn.commit()
+
+    def to_job(self, row):
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def add(self, url, quality, save_path, priority=0, options=None):
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (url, quality, save_path, priority, options, state, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, quality, save_path, priority, json.dumps(options or {}), QUEUED, time.time())
+            )
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self.to_job(row) if row else None
+
+    def all(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+        return [self.to_job(row) for row in rows]
+
+    def next_queued(self, exclude=()):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE state = ? ORDER BY priority DESC, id", (QUEUED,)
+            ).fetchall()
+        return next((self.to_job(row) for row in rows if row["id"] not in exclude), None)
+
+    def set_state(self, job_id, state):
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET state = ? WHERE id = ?", (state, job_id))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class FairSlots:
+    # The global concurrency budget. A free slot goes to the waiting job with the
+    # highest priority; among equal priorities, to the job holding the fewest slots.
+    def __init__(self, size):
+        self.size = max(1, size)
+        self.condition = threading.Condition()
+        self.held = {}
+        self.waiting = []
+        self.sequence = itertools.count()
+
+    def resize(self, size):
+        with self.condition:
+            self.size = max(1, size)
+            self.condition.notify_all()
+
+    def best(self):
+        return min(self.waiting, key=lambda ticket: (-ticket[1], self.held.get(ticket[0], 0), ticket[2]))
+
+    def acquire(self, key, priority=0, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            ticket = (key, priority, next(self.sequence))
+            self.waiting.append(ticket)
+            try:
+                while sum(self.held.values()) >= self.size or self.best() is not ticket:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+                self.held[key] = self.held.get(key, 0) + 1
+                return True
+            finally:
+                self.waiting.remove(ticket)
+                self.condition.notify_all()
+
+    def release(self, key):
+        with self.condition:
+            self.held[key] -= 1
+            if not self.held[key]:
+                del self.held[key]
+            self.condition.notify_all()
+
+
+class JobScheduler:
+    def __init__(self, store, budget=4, max_active_jobs=3, on_job_state=downloader.ignore,
+                 on_job_progress=downloader.ignore, on_log=downloader.ignore, on_video_downloaded=downloader.ignore):
+        self.store = store
+        self.slots = FairSlots(budget)
+        self.max_active_jobs = max(1, max_active_jobs)
+        self.on_job_state = on_job_state
+        self.on_job_progress = on_job_progress
+        self.on_log = on_log
+        self.on_video_downloaded = on_video_downloaded
+        self.active = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self._is_running = True
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def set_budget(self, budget):
+        self.slots.resize(budget)
+
+    def add(self, url, quality, save_path, priority=0, **options):
+        job_id = self.store.add(url, quality, save_path, priority, options)
+        self.on_job_state(job_id, QUEUED)
+        self.wakeup.set()
+        return job_id
+
+    def set_state(self, job_id, state):
+        self.store.set_state(job_id, state)
+        self.on_job_state(job_id, state)
+
+    def pause(self, job_id):
+        # The engine's journal keeps finished videos, so a paused job picks up where it stopped
+        job = self.store.get(job_id)
+        if job and job["state"] in (QUEUED, RUNNING):
+            self.set_state(job_id, PAUSED)
+            self.stop_engine(job_id)
+
+    def resume(self, job_id):
+        job = self.store.get(job_id)
+        if job and job["state"] in (PAUSED, FAILED):
+            self.set_state(job_id, QUEUED)
+            self.wakeup.set()
+
+    def cancel(self, job_id):
+        job = self.store.get(job_id)
+        if job and job["state"] not in (DONE, CANCELLED):
+            self.set_state(job_id, CANCELLED)
+            self.stop_engine(job_id)
+
+    def stop_engine(self, job_id):
+        with self.lock:
+            engine = self.active.get(job_id)
+        if engine:
+            engine.stop()
+
+    def loop(self):
+        while self._is_running:
+            with self.lock:
+                while len(self.active) < self.max_active_jobs:
+                    job = self.store.next_queued(exclude=self.active)
+                    if not job:
+                        break
+                    self.launch(job)
+            self.wakeup.wait(1.0)
+            self.wakeup.clear()
+
+    def launch(self, job):
+        job_id = job["id"]
+        result = {"finished": False}
+        engine = downloader.PlaylistDownloader(
+            job["url"], job["quality"], job["save_path"],
+            max_workers=self.slots.size,
+            slots=self.slots,
+            slot_key=job_id,
+            priority=job["priority"],
+            on_log=lambda message: self.on_log(job_id, message),
+            on_progress=lambda percent: self.on_job_progress(job_id, percent),
+            on_video_downloaded=lambda path: self.on_video_downloaded(path, engine.metrics),
+            on_finished=lambda: result.update(finished=True),
+            on_error=lambda message: self.on_log(job_id, message),
+            **job["options"]
+        )
+        self.active[job_id] = engine
+        self.set_state(job_id, RUNNING)
+        threading.Thread(target=self.run_job, args=(job_id, engine, result), daemon=True).start()
+
+    def run_job(self, job_id, engine, result):
+        try:
+            engine.run()
+        finally:
+            with self.lock:
+                del self.active[job_id]
+            # Pause, cancel and shutdown set their own state before stopping the engine
+            if self.store.get(job_id)["state"] == RUNNING:
+                self.set_state(job_id, DONE if result["finished"] else FAILED)
+            self.wakeup.set()
+
+    def shutdown(self):
+        self._is_running = False
+        self.wakeup.set()
+        with self.lock:
+            engines = dict(self.active)
+        for job_id, engine in engines.items():
+            self.store.set_state(job_id, QUEUED)
+            engine.stop()
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import threading
+import time
+
+PENDING = "pending"
+DOWNLOADING = "downloading"
+DONE = "done"
+FAILED = "failed"
+
+JOURNAL_NAME = ".wt_journal.sqlite3"
+
+
+class DownloadJournal:
+    # Per-video download state kept in the save folder so a crash or a restart
+    # of the app does not lose track of what is already on disk.
+    def __init__(self, save_path, playlist_url):
+        self.playlist_url = playlist_url
+        self.path = os.path.join(save_path, JOURNAL_NAME)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                playlist_url TEXT NOT NULL,
+                video_url TEXT NOT NULL,
+                position INTEGER,
+                state TEXT NOT NULL,
+                bytes_written INTEGER NOT NULL DEFAULT 0,
+                itag INTEGER,
+                output_path TEXT,
+                updated REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                error_kind TEXT,
+                PRIMARY KEY (playlist_url, video_url)
+            )
+        """)
+        # Journals written before retries were tracked lack these columns
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(videos)")}
+        for column, definition in (("attempts", "INTEGER NOT NULL DEFAULT 0"), ("error", "TEXT"), ("error_kind", "TEXT")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE videos ADD COLUMN {column} {definition}")
+        self.conn.commit()
+
+    def add_pending(self, entries):
+        # entries: (position, video_url) pairs
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO videos (playlist_url, video_url, position, state, updated) VALUES (?, ?, ?, ?, ?)",
+                [(self.playlist_url, url, index, PENDING, now) for index, url in entries]
+            )
+            self.conn.commit()
+
+    def finished(self):
+        # {video_url: output_path} for entries whose file is still where we left it
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT video_url, output_path FROM videos WHERE playlist_url = ? AND state = ?",
+                (self.playlist_url, DONE)
+            ).fetchall()
+        return {url: path for url, path in rows if path and os.path.exists(path)}
+
+    def retryable_failures(self):
+        # The retry queue: entries that ran out of attempts on errors that may go away
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT video_url FROM videos WHERE playlist_url = ? AND state = ? AND error_kind = 'retryable'",
+                (self.playlist_url, FAILED)
+            ).fetchall()
+        return {url for url, in rows}
+
+    def update(self, video_url, state, bytes_written=None, itag=None, output_path=None,
+               attempts=None, error=None, error_kind=None):
+        with self.lock:
+            self.conn.execute(
+                """UPDATE videos SET state = ?,
+                       bytes_written = COALESCE(?, bytes_written),
+                       itag = COALESCE(?, itag),
+                       output_path = COALESCE(?, output_path),
+                       attempts = COALESCE(?, attempts),
+                       error = ?,
+                       error_kind = ?,
+                       updated = ?
+                   WHERE playlist_url = ? AND video_url = ?""",
+                (state, bytes_written, itag, output_path, attempts, error, error_kind, time.time(),
+                 self.playlist_url, video_url)
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
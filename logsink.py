@@ -0,0 +1,89 @@
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+LOG_NAME = ".wt_download.log"
+MAX_LINES = 5000
+FLUSH_INTERVAL_MS = 200
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 3
+
+LEVELS = {"All": logging.DEBUG, "Info": logging.INFO, "Warnings": logging.WARNING, "Errors": logging.ERROR}
+
+
+def level_of(message):
+    # The engine reports plain strings; their wording says how serious they are
+    if message.startswith(("Error", "Enhancement error")):
+        return logging.ERROR
+    if message.startswith("Retrying") or " not available for " in message or " videos failed " in message:
+        return logging.WARNING
+    return logging.INFO
+
+
+class LogSink:
+    # Collects log lines from any thread. The view drains a bounded buffer on a timer,
+    # so a burst of messages costs one UI update; every line also goes to a rotating
+    # file in the save folder, written by a background thread.
+    def __init__(self, max_lines=MAX_LINES, view_level=logging.INFO):
+        self.pending = collections.deque(maxlen=max_lines)
+        self.dropped = 0
+        self.view_level = view_level
+        self.lock = threading.Lock()
+        self.files = queue.Queue()
+        self.handlers = {}
+        self.writer = threading.Thread(target=self.write_files, daemon=True)
+        self.writer.start()
+
+    def write(self, message, level=None, save_path=None):
+        level = level_of(message) if level is None else level
+        created = time.time()
+        if save_path:
+            self.files.put((save_path, level, message, created))
+        if level < self.view_level:
+            return
+        with self.lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(message)
+
+    def drain(self):
+        with self.lock:
+            lines = list(self.pending)
+            dropped = self.dropped
+            self.pending.clear()
+            self.dropped = 0
+        return lines, dropped
+
+    def handler(self, save_path):
+        handler = self.handlers.get(save_path)
+        if handler is None:
+            handler = logging.handlers.RotatingFileHandler(
+                os.path.join(save_path, LOG_NAME), maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+            self.handlers[save_path] = handler
+        return handler
+
+    def write_files(self):
+        while True:
+            item = self.files.get()
+            if item is None:
+                break
+            save_path, level, message, created = item
+            record = logging.makeLogRecord({
+                "levelno": level, "levelname": logging.getLevelName(level), "msg": message, "created": created,
+            })
+            try:
+                self.handler(save_path).emit(record)
+            except OSError:
+                pass
+        for handler in self.handlers.values():
+            handler.close()
+
+    def close(self):
+        self.files.put(None)
+        self.writer.join()
@@ -1,42 +1,38 @@
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QLineEdit, QComboBox,
-    QPushButton, QProgressBar, QMessageBox, QTextEdit, QFileDialog
+    QPushButton, QProgressBar, QMessageBox, QTextEdit, QFileDialog, QSpinBox
 )
 from PyQt5.QtGui import QFont, QIcon, QColor
 from PyQt5.QtCore import QThread, pyqtSignal, Qt, QUrl
 import sys
-from pytube import Playlist, YouTube
 import os
+import downloader
 
 
 
 class DownloadThread(QThread):
+    # Thin Qt adapter over the shared download engine, like the one in new_main.py
     progress = pyqtSignal(int)
     log = pyqtSignal(str)
     finished = pyqtSignal()
+    error = pyqtSignal(str)
 
-    def __init__(self, playlist_url, quality, save_path, parent=None):
+    def __init__(self, playlist_url, quality, save_path, max_workers=4, parent=None):
         super(DownloadThread, self).__init__(parent)
-        self.playlist_url = playlist_url
-        self.quality = quality
-        self.save_path = save_path
+        self.downloader = downloader.PlaylistDownloader(
+            playlist_url, quality, save_path,
+            max_workers=max_workers,
+            on_log=self.log.emit,
+            on_progress=self.progress.emit,
+            on_finished=self.finished.emit,
+            on_error=self.error.emit
+        )
+
+    def stop(self):
+        self.downloader.stop()
 
     def run(self):
-        try:
-            playlist = Playlist(self.playlist_url)
-            total_videos = len(playlist.video_urls)
-            for index, video_url in enumerate(playlist.video_urls):
-                yt = YouTube(video_url)
-                stream = yt.streams.filter(res=self.quality, file_extension='mp4').first()
-                if stream:
-                    stream.download(output_path=self.save_path)
-                    self.log.emit(f"Downloaded: {yt.title}")
-                else:
-                    self.log.emit(f"No stream found for {yt.title} at {self.quality}")
-                self.progress.emit(int((index + 1) / total_videos * 100))
-            self.finished.emit()
-        except Exception as e:
-            self.log.emit(f"Error: {e}")
+        self.downloader.run()
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -45,6 +41,7 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("WT YouTube Playlist Downloader")
         self.setGeometry(100, 100, 800, 600)
         self.setWindowIcon(QIcon(os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets/logo.png")))
+        self.download_thread = None
         # self.setWindowIcon(QIcon("assets/logo.png"))
         self.main_layout = QVBoxLayout()
 
@@ -107,6 +104,18 @@ class MainWindow(QMainWindow):
 
         self.form_layout.addLayout(self.save_path_layout)
 
+        self.workers_label = QLabel("Parallel Downloads:")
+        self.workers_label.setFont(QFont("Arial", 14))
+        self.workers_label.setStyleSheet("color: #000000;")  # Black
+        self.form_layout.addWidget(self.workers_label)
+
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 16)
+        self.workers_spin.setValue(4)
+        self.workers_spin.setFont(QFont("Arial", 12))
+        self.workers_spin.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 5px; border: 1px solid #3399FF; border-radius: 5px;")
+        self.form_layout.addWidget(self.workers_spin)
+
         self.download_button = QPushButton("Download Playlist")
         self.download_button.setFont(QFont("Arial", 14))
         self.download_button.setStyleSheet("""
@@ -206,10 +215,11 @@ class MainWindow(QMainWindow):
             return
 
         self.download_button.setEnabled(False)
-        self.download_thread = DownloadThread(playlist_url, quality, save_path)
+        self.download_thread = DownloadThread(playlist_url, quality, save_path, max_workers=self.workers_spin.value())
         self.download_thread.progress.connect(self.update_progress)
         self.download_thread.log.connect(self.update_log)
         self.download_thread.finished.connect(self.download_finished)
+        self.download_thread.error.connect(self.download_failed)
         self.download_thread.start()
 
     def update_progress(self, value):
@@ -225,6 +235,17 @@ class MainWindow(QMainWindow):
         QMessageBox.information(self, "Done", "All videos have been downloaded!")
         self.download_button.setEnabled(True)
 
+    def download_failed(self, message):
+        self.update_log(message)
+        QMessageBox.warning(self, "Error", message)
+        self.download_button.setEnabled(True)
+
+    def closeEvent(self, event):
+        # Finished videos are in the folder's journal, so the next run continues from there
+        if self.download_thread:
+            self.download_thread.stop()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainWindow()
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+MANIFEST_NAME = ".wt_manifest.sqlite3"
+
+
+def video_id(video_url):
+    parsed = urlparse(video_url)
+    if parsed.hostname and parsed.hostname.endswith("youtu.be"):
+        return parsed.path.lstrip("/")
+    return parse_qs(parsed.query).get("v", [video_url])[0]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def refresh_file(path):
+    # For callers outside a download run, e.g. after post-processing rewrote the file in place
+    folder_manifest = Manifest(os.path.dirname(path))
+    try:
+        folder_manifest.refresh(path)
+    finally:
+        folder_manifest.close()
+
+
+class Manifest:
+    # Index of every video stored in a folder, keyed by video id, used to sync
+    # a folder against a playlist without touching the network for known entries.
+    # Several playlists can share a folder, so each video also lists the playlists
+    # that contain it and is only removed once none of them does.
+    def __init__(self, save_path):
+        self.path = os.path.join(save_path, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                playlist_url TEXT,
+                itag INTEGER,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                path TEXT NOT NULL,
+                updated REAL
+            )
+        """)
+        has_owners = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'owners'"
+        ).fetchone()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS owners (
+                video_id TEXT NOT NULL,
+                playlist_url TEXT NOT NULL,
+                PRIMARY KEY (video_id, playlist_url)
+            )
+        """)
+        if not has_owners:
+            # Older manifests only remember the last playlist that downloaded each video
+            self.conn.execute(
+                "INSERT OR IGNORE INTO owners SELECT video_id, playlist_url FROM videos WHERE playlist_url IS NOT NULL"
+            )
+        self.conn.commit()
+
+    def current_ids(self):
+        # Ids whose file is still on disk with the size we recorded; a stat per entry, no hashing
+        with self.lock:
+            rows = self.conn.execute("SELECT video_id, path, size FROM videos").fetchall()
+        return {vid for vid, path, size in rows if os.path.exists(path) and os.path.getsize(path) == size}
+
+    def record(self, vid, playlist_url, itag, path):
+        size, sha256 = os.path.getsize(path), file_hash(path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO videos (video_id, playlist_url, itag, size, sha256, path, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (vid, playlist_url, itag, size, sha256, path, time.time())
+            )
+            self.conn.execute("INSERT OR IGNORE INTO owners (video_id, playlist_url) VALUES (?, ?)", (vid, playlist_url))
+            self.conn.commit()
+
+    def add_owners(self, vids, playlist_url):
+        # For videos another playlist already put in the folder
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO owners (video_id, playlist_url) VALUES (?, ?)",
+                [(vid, playlist_url) for vid in vids]
+            )
+            self.conn.commit()
+
+    def path_owner(self, path):
+        with self.lock:
+            row = self.conn.execute("SELECT video_id FROM videos WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def refresh(self, path):
+        # The file was rewritten in place (e.g. by post-processing)
+        size, sha256 = os.path.getsize(path), file_hash(path)
+        with self.lock:
+            self.conn.execute(
+                "UPDATE videos SET size = ?, sha256 = ?, updated = ? WHERE path = ?",
+                (size, sha256, time.time(), path)
+            )
+            self.conn.commit()
+
+    def prune(self, playlist_url, keep_ids):
+        # Drops this playlist's claim on videos it no longer lists; files go only when
+        # no other playlist in the folder still lists them
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT videos.video_id, videos.path FROM owners JOIN videos ON videos.video_id = owners.video_id "
+                "WHERE owners.playlist_url = ?", (playlist_url,)
+            ).fetchall()
+            removed = []
+            for vid, path in rows:
+                if vid in keep_ids:
+                    continue
+                self.conn.execute("DELETE FROM owners WHERE video_id = ? AND playlist_url = ?", (vid, playlist_url))
+                if self.conn.execute("SELECT 1 FROM owners WHERE video_id = ?", (vid,)).fetchone():
+                    continue
+                if os.path.exists(path):
+                    os.remove(path)
+                self.conn.execute("DELETE FROM videos WHERE video_id = ?", (vid,))
+                removed.append(path)
+            self.conn.commit()
+        return removed
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
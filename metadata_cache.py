@@ -0,0 +1,157 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import network
+import resumable
+import streams
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".wt_playlist_downloader", "metadata.sqlite3")
+DEFAULT_TTL = 7 * 24 * 60 * 60
+MAX_ENTRIES = 50000
+MAX_BYTES = 64 * 1024 * 1024
+# A cached stream URL must stay valid for at least this long to be handed to a download
+URL_MARGIN = 30 * 60
+
+STREAM_FIELDS = (
+    "itag", "url", "default_filename", "resolution", "is_progressive", "is_adaptive", "type", "subtype",
+    "mime_type", "video_codec", "audio_codec", "bitrate", "abr", "includes_video_track", "includes_audio_track",
+)
+
+
+def url_expiry(url):
+    # Signed googlevideo URLs carry their expiry time as a query parameter
+    try:
+        return float(parse_qs(urlparse(url).query)["expire"][0])
+    except (KeyError, ValueError):
+        return None
+
+
+def known_filesize(stream):
+    # pytube fills _filesize from the format's contentLength; reading .filesize when it is
+    # missing would cost a HEAD request per stream, so those are left for later
+    size = getattr(stream, "_filesize", None)
+    return size or None
+
+
+class CachedStream:
+    def __init__(self, data):
+        self.__dict__.update(data)
+
+    @property
+    def filesize(self):
+        if not self._filesize:
+            with network.POOL.request(self.url, headers=resumable.HEADERS, method="HEAD") as response:
+                response.read()
+                self._filesize = int(response.getheader("Content-Length") or 0)
+        return self._filesize
+
+
+class CachedVideo:
+    # Stands in for a pytube YouTube object wherever the engine or the UI reads metadata
+    def __init__(self, video_url, data):
+        self.watch_url = video_url
+        self.title = data["title"]
+        self.length = data["length"]
+        self.author = data["author"]
+        self.thumbnail_url = data["thumbnail_url"]
+        self.streams = streams.StreamList(CachedStream(s) for s in data["streams"])
+
+
+def serialize(yt, available):
+    stream_data = []
+    for stream in available:
+        data = {field: getattr(stream, field, None) for field in STREAM_FIELDS}
+        data["_filesize"] = known_filesize(stream)
+        stream_data.append(data)
+    return {
+        "title": yt.title,
+        "length": yt.length,
+        "author": yt.author,
+        "thumbnail_url": yt.thumbnail_url,
+        "streams": stream_data,
+    }
+
+
+class MetadataCache:
+    # Video metadata keyed by video id. Titles, lengths and stream lists stay valid for
+    # the TTL; stream URLs only until YouTube's signature expires, after which an entry
+    # is still good for previews and sync but not for downloading. The least recently
+    # used entries are evicted once the cache grows past max_entries or max_bytes.
+    def __init__(self, path=CACHE_PATH, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                fetched REAL NOT NULL,
+                urls_expire REAL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS videos_last_used ON videos (last_used)")
+        self.conn.commit()
+
+    def get(self, vid, video_url, need_urls=False):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data, fetched, urls_expire FROM videos WHERE video_id = ?", (vid,)
+            ).fetchone()
+            if not row:
+                return None
+            data, fetched, urls_expire = row
+            if now - fetched > self.ttl:
+                self.conn.execute("DELETE FROM videos WHERE video_id = ?", (vid,))
+                self.conn.commit()
+                return None
+            if need_urls and (urls_expire is None or urls_expire - now < URL_MARGIN):
+                return None
+            self.conn.execute("UPDATE videos SET last_used = ? WHERE video_id = ?", (now, vid))
+            self.conn.commit()
+        return CachedVideo(video_url, json.loads(data))
+
+    def put(self, vid, yt, available):
+        data = json.dumps(serialize(yt, available))
+        expiries = [e for e in (url_expiry(s.url) for s in available) if e]
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO videos (video_id, data, size, fetched, urls_expire, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (vid, data, len(data), now, min(expiries) if expiries else None, now)
+            )
+            self.evict()
+            self.conn.commit()
+
+    def invalidate(self, vid):
+        with self.lock:
+            self.conn.execute("DELETE FROM videos WHERE video_id = ?", (vid,))
+            self.conn.commit()
+
+    def evict(self):
+        count, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM videos").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT video_id, size FROM videos ORDER BY last_used").fetchall()
+        evicted = []
+        for vid, entry_size in rows:
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            evicted.append((vid,))
+            count -= 1
+            size -= entry_size
+        self.conn.executemany("DELETE FROM videos WHERE video_id = ?", evicted)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,182 @@
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUMMARY_NAME = ".wt_metrics.json"
+PROFILE_NAME = ".wt_profile.pstats"
+# Upper bounds in seconds, Prometheus style; the last bucket catches everything
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float("inf"))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[next(i for i, bound in enumerate(BUCKETS) if value <= bound)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "seconds": round(self.total, 4),
+            "mean": round(self.total / self.count, 4) if self.count else None,
+            "p50": round(self.quantile(0.5), 4) if self.count else None,
+            "p95": round(self.quantile(0.95), 4) if self.count else None,
+            "max": round(self.max, 4),
+        }
+
+
+class Metrics:
+    # Span timings per phase (and per item), plus counters. A run records into its
+    # own Metrics for the end-of-run summary; everything is also forwarded to the
+    # parent, normally the process-wide REGISTRY behind the HTTP endpoint.
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.items = {}
+        self.started = time.time()
+        self.save_path = None
+        self.write_lock = threading.Lock()
+
+    def observe(self, phase, seconds, item=None):
+        with self.lock:
+            self.histograms.setdefault(phase, Histogram()).observe(seconds)
+            if item is not None:
+                phases = self.items.setdefault(item, {})
+                phases[phase] = phases.get(phase, 0.0) + seconds
+        if self.parent:
+            self.parent.observe(phase, seconds)
+
+    @contextlib.contextmanager
+    def span(self, phase, item=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start, item)
+
+    def add(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+        if self.parent:
+            self.parent.add(counter, amount)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "started": self.started,
+                "seconds": round(time.time() - self.started, 3),
+                "counters": dict(self.counters),
+                "phases": {phase: h.summary() for phase, h in self.histograms.items()},
+                "items": {item: {phase: round(s, 4) for phase, s in phases.items()}
+                          for item, phases in self.items.items()},
+            }
+
+    def write_summary(self, save_path):
+        path = os.path.join(save_path, SUMMARY_NAME)
+        with self.write_lock:
+            with open(path + ".tmp", "w") as f:
+                json.dump(self.summary(), f, indent=2)
+            os.replace(path + ".tmp", path)
+            self.save_path = save_path
+        return path
+
+    def rewrite_summary(self):
+        # Post-processing can finish after the run wrote its summary; bring the file up to date
+        if self.save_path:
+            self.write_summary(self.save_path)
+
+    def exposition(self):
+        # Prometheus text format
+        lines = ["# TYPE wt_phase_seconds histogram"]
+        with self.lock:
+            for phase, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'wt_phase_seconds_bucket{{phase="{phase}",le="{le}"}} {cumulative}')
+                lines.append(f'wt_phase_seconds_sum{{phase="{phase}"}} {histogram.total}')
+                lines.append(f'wt_phase_seconds_count{{phase="{phase}"}} {histogram.count}')
+            for counter, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE wt_{counter}_total counter")
+                lines.append(f"wt_{counter}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        data = self.server.metrics.exposition().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(port, metrics=None, host="127.0.0.1"):
+    # Local only by default; scrape http://127.0.0.1:<port>/metrics
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics or REGISTRY
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Profiler:
+    # cProfile only sees the thread it was enabled on, so every worker thread gets
+    # its own profile and they are merged when the run ends
+    def __init__(self):
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def run(self, target, *args):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return target(*args)
+        finally:
+            profile.disable()
+            with self.lock:
+                self.profiles.append(profile)
+
+    def dump(self, save_path):
+        with self.lock:
+            if not self.profiles:
+                return None
+            stats = pstats.Stats(*self.profiles)
+        path = os.path.join(save_path, PROFILE_NAME)
+        stats.dump_stats(path)
+        return path
+
+
+REGISTRY = Metrics()
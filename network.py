@@ -0,0 +1,183 @@
+import contextlib
+import http.client
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urljoin, urlsplit
+
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+UNITS = {"": 1, "K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, url, status, reason=""):
+        super().__init__(f"HTTP {status} {reason}".strip())
+        self.url = url
+        self.status = status
+
+
+def parse_rate(text):
+    # "2M" -> 2 MiB/s, "500K" -> 500 KiB/s, "0" -> unlimited
+    text = text.strip().upper().replace("/S", "").rstrip("B")
+    unit = text[-1] if text and text[-1] in UNITS else ""
+    value = float(text[:-1] if unit else text)
+    if value < 0:
+        raise ValueError(f"Rate cannot be negative: {text}")
+    return int(value * UNITS[unit]) or None
+
+
+class BandwidthSchedule:
+    # Time-of-day caps such as "09:00-18:00=2M,22:00-07:00=0"; ranges may wrap past midnight
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+
+    @classmethod
+    def parse(cls, text):
+        rules = []
+        for part in filter(None, (p.strip() for p in text.split(","))):
+            span, _, rate = part.partition("=")
+            start, _, end = span.partition("-")
+            rules.append((cls.minutes(start), cls.minutes(end), parse_rate(rate)))
+        return cls(rules)
+
+    @staticmethod
+    def minutes(text):
+        hours, _, minutes = text.strip().partition(":")
+        return int(hours) * 60 + int(minutes or 0)
+
+    def matches(self, now=None):
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.rules:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return True, rate
+        return False, None
+
+
+class RateLimiter:
+    # Token bucket shared by every download in the process. A consumer may overdraw
+    # the bucket by one chunk; later consumers wait until it has refilled.
+    def __init__(self, rate=None, schedule=None, burst_seconds=1.0):
+        self.rate = rate
+        self.schedule = schedule
+        self.burst_seconds = burst_seconds
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate or None
+
+    def set_schedule(self, schedule):
+        with self.lock:
+            self.schedule = schedule
+
+    def current_rate(self):
+        if self.schedule:
+            matched, rate = self.schedule.matches()
+            if matched:
+                return rate
+        return self.rate
+
+    def consume(self, nbytes, check=None):
+        while True:
+            with self.lock:
+                rate = self.current_rate()
+                now = time.monotonic()
+                if not rate:
+                    self.tokens = 0.0
+                    self.updated = now
+                    return
+                self.tokens = min(rate * self.burst_seconds, self.tokens + (now - self.updated) * rate)
+                self.updated = now
+                if self.tokens >= 0:
+                    self.tokens -= nbytes
+                    return
+                delay = -self.tokens / rate
+            # Short sleeps so a rate change or a stop takes effect promptly
+            time.sleep(min(delay, 0.25))
+            if check:
+                check()
+
+
+class ConnectionPool:
+    # Keep-alive HTTP(S) connections reused per (scheme, host, port)
+    def __init__(self, max_idle_per_host=8, timeout=30):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def connect(self, key):
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(host, port, timeout=self.timeout)
+
+    def checkout(self, key):
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                return connections.pop(), True
+        return self.connect(key), False
+
+    def checkin(self, key, connection, response):
+        # Only a fully read response leaves the connection in a reusable state
+        if response.isclosed() and not response.will_close:
+            with self.lock:
+                connections = self.idle.setdefault(key, [])
+                if len(connections) < self.max_idle_per_host:
+                    connections.append(connection)
+                    return
+        connection.close()
+
+    def send(self, key, method, target, headers):
+        connection, reused = self.checkout(key)
+        try:
+            connection.request(method, target, headers=headers)
+            return connection, connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            if not reused:
+                raise
+        # The server dropped an idle keep-alive connection; retry once on a fresh one
+        connection = self.connect(key)
+        connection.request(method, target, headers=headers)
+        return connection, connection.getresponse()
+
+    @contextlib.contextmanager
+    def request(self, url, headers=None, method="GET"):
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            key = (parts.scheme, parts.hostname, parts.port)
+            target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            connection, response = self.send(key, method, target, dict(headers or {}))
+            location = response.getheader("Location")
+            if response.status in REDIRECT_STATUSES and location:
+                response.read()
+                self.checkin(key, connection, response)
+                url = urljoin(url, location)
+                continue
+            if response.status >= 400:
+                response.read()
+                self.checkin(key, connection, response)
+                raise HTTPStatusError(url, response.status, response.reason)
+            try:
+                yield response
+            finally:
+                self.checkin(key, connection, response)
+            return
+        raise HTTPStatusError(url, 310, "Too many redirects")
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+
+POOL = ConnectionPool()
+LIMITER = RateLimiter()
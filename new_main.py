@@ -1,53 +1,157 @@
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QLineEdit, QComboBox,
-    QPushButton, QProgressBar, QMessageBox, QTextEdit, QFileDialog
+    QPushButton, QProgressBar, QMessageBox, QPlainTextEdit, QFileDialog, QSpinBox, QCheckBox,
+    QTableWidget, QTableWidgetItem, QTableView, QHeaderView, QAbstractItemView
 )
 from PyQt5.QtGui import QFont, QIcon
-from PyQt5.QtCore import QThread, pyqtSignal, Qt
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QObject, QThread, QTimer, pyqtSignal, Qt
 import sys
-from pytube import Playlist, YouTube
 import os
-import ffmpeg  # Import ffmpeg
+import downloader
+import jobs
+import journal
+import logsink
+import manifest
+import network
+import playlist_cache
+import progress
+import postprocess
+import preview
+import streams
 
 class DownloadThread(QThread):
     progress = pyqtSignal(int)
     log = pyqtSignal(str)
     finished = pyqtSignal()
     resume_download = pyqtSignal(int)
-    video_downloaded = pyqtSignal(str)
+    video_downloaded = pyqtSignal(str, object)
+    videos_found = pyqtSignal(int)
+    stats = pyqtSignal(dict)
+    error = pyqtSignal(str)
 
-    def __init__(self, playlist_url, quality, save_path, start_index=0, parent=None):
+    def __init__(self, playlist_url, quality, save_path, parent=None, **options):
         super(DownloadThread, self).__init__(parent)
-        self.playlist_url = playlist_url
-        self.quality = quality
-        self.save_path = save_path
-        self.start_index = start_index
-        self._is_running = True
+        self.downloader = downloader.PlaylistDownloader(
+            playlist_url, quality, save_path,
+            on_log=self.log.emit,
+            on_progress=self.progress.emit,
+            on_stats=self.stats.emit,
+            on_videos_found=self.videos_found.emit,
+            # Emit signal when download is finished, with the run's metrics for the enhance step
+            on_video_downloaded=lambda path: self.video_downloaded.emit(path, self.downloader.metrics),
+            on_resume=self.resume_download.emit,
+            on_finished=self.finished.emit,
+            on_error=self.error.emit,
+            **options
+        )
 
     def stop(self):
-        self._is_running = False
+        self.downloader.stop()
 
     def run(self):
-        try:
-            playlist = Playlist(self.playlist_url)
-            total_videos = len(playlist.video_urls)
-            for index, video_url in enumerate(playlist.video_urls):
-                if not self._is_running:
-                    self.resume_download.emit(index)
-                    return
-
-                yt = YouTube(video_url)
-                stream = yt.streams.filter(res=self.quality, file_extension='mp4').first()
-                if stream:
-                    output_path = stream.download(output_path=self.save_path)
-                    self.log.emit(f"Downloaded: {yt.title}")
-                    self.video_downloaded.emit(output_path)  # Emit signal when download is finished
-                else:
-                    self.log.emit(f"No stream found for {yt.title} at {self.quality}")
-                self.progress.emit(int((index + 1) / total_videos * 100))
-            self.finished.emit()
-        except Exception as e:
-            self.log.emit(f"Error: {e}")
+        self.downloader.run()
+
+class TranscodeSignals(QObject):
+    # Carries events from the transcode pool's worker threads back to the GUI thread
+    progress = pyqtSignal(str, int)
+    done = pyqtSignal(str, str, str)
+    log = pyqtSignal(str)
+
+class JobSignals(QObject):
+    # Carries events from the job scheduler's threads back to the GUI thread
+    state_changed = pyqtSignal(int, str)
+    progress = pyqtSignal(int, int)
+    log = pyqtSignal(int, str)
+    video_downloaded = pyqtSignal(str, object)
+
+class PreviewSignals(QObject):
+    # Carries events from the preview loader's threads back to the GUI thread
+    rows = pyqtSignal(int)
+    loaded = pyqtSignal(int)
+    error = pyqtSignal(str)
+
+class PreviewModel(QAbstractTableModel):
+    # Rows exist as soon as the playlist listing has them; their metadata is filled in
+    # when the loader gets to them, which only happens for rows that are on screen
+    HEADERS = ["", "#", "Title", "Duration", "Qualities", "Est. Size"]
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.rows = 0
+        # Rows whose tick differs from the default, so thousands of rows cost nothing
+        self.checked_by_default = True
+        self.toggled = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        return flags | Qt.ItemIsUserCheckable if index.column() == 0 else flags
+
+    def is_checked(self, row):
+        return self.checked_by_default != (row in self.toggled)
+
+    def data(self, index, role=Qt.DisplayRole):
+        row, column = index.row(), index.column()
+        if column == 0:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if self.is_checked(row) else Qt.Unchecked
+            return None
+        if role != Qt.DisplayRole:
+            return None
+        if column == 1:
+            return str(row + 1)
+        info = self.loader.row_info(row)
+        if info is None:
+            return "Loading..." if column == 2 else ""
+        if column == 2:
+            return info["title"]
+        if column == 3:
+            return progress.format_eta(info["length"]) if info["length"] else ""
+        if column == 4:
+            return ", ".join(info["qualities"])
+        return f"{info['size'] / (1024 * 1024):.0f} MB" if info["size"] else "?"
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if index.column() != 0 or role != Qt.CheckStateRole:
+            return False
+        if (value == Qt.Checked) != self.is_checked(index.row()):
+            self.toggled ^= {index.row()}
+        self.dataChanged.emit(index, index)
+        return True
+
+    def set_all(self, checked):
+        self.checked_by_default = checked
+        self.toggled = set()
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rows - 1, 0))
+
+    def add_rows(self, count):
+        if count > self.rows:
+            self.beginInsertRows(QModelIndex(), self.rows, count - 1)
+            self.rows = count
+            self.endInsertRows()
+
+    def row_loaded(self, row):
+        self.dataChanged.emit(self.index(row, 2), self.index(row, len(self.HEADERS) - 1))
+
+    def engine_options(self):
+        # Ticked by default: list what was unticked, so rows still being listed are included.
+        # Unticked by default: list only what was ticked.
+        urls = [self.loader.url(row) for row in sorted(self.toggled)]
+        if self.checked_by_default:
+            return {"exclude_urls": urls} if urls else {}
+        return {"only_urls": urls}
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -57,10 +161,46 @@ class MainWindow(QMainWindow):
         self.setGeometry(100, 100, 800, 600)
         self.setWindowIcon(QIcon(os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets/logo.png")))
 
+        self.log_sink = logsink.LogSink()
         self.init_ui()
         self.center_window()
         self.download_thread = None
-        self.resume_index = 0
+        self.download_path = None
+        self.preview_loader = None
+        self.preview_model = None
+        self.preview_url = None
+        self.preview_signals = PreviewSignals()
+        self.preview_signals.rows.connect(self.add_preview_rows)
+        self.preview_signals.loaded.connect(lambda row: self.preview_model.row_loaded(row))
+        self.preview_signals.error.connect(self.update_log)
+        # Log lines are batched and appended to the view a few times a second
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(logsink.FLUSH_INTERVAL_MS)
+        self.transcode_pool = None
+        self.transcode_signals = TranscodeSignals()
+        self.transcode_signals.progress.connect(self.update_transcode_progress)
+        self.transcode_signals.done.connect(self.transcode_finished)
+        self.transcode_signals.log.connect(self.update_log)
+
+        self.job_signals = JobSignals()
+        self.job_signals.state_changed.connect(self.update_job_state)
+        self.job_signals.progress.connect(self.update_job_progress)
+        self.job_signals.log.connect(self.update_job_log)
+        self.job_signals.video_downloaded.connect(self.enhance_video)
+        self.job_rows = {}
+        self.job_paths = {}
+        self.scheduler = jobs.JobScheduler(
+            jobs.JobStore(),
+            budget=self.workers_spin.value(),
+            on_job_state=self.job_signals.state_changed.emit,
+            on_job_progress=self.job_signals.progress.emit,
+            on_log=self.job_signals.log.emit,
+            on_video_downloaded=self.job_signals.video_downloaded.emit
+        )
+        self.workers_spin.valueChanged.connect(self.scheduler.set_budget)
+        self.refresh_queue()
+        self.scheduler.start()
 
     def init_ui(self):
         self.main_layout = QVBoxLayout()
@@ -85,10 +225,21 @@ class MainWindow(QMainWindow):
         self.quality_label.setStyleSheet("color: #000000;")
 
         self.quality_combo = QComboBox()
-        self.quality_combo.addItems(["1080p", "720p", "480p", "360p", "240p"])
+        for quality in ["1080p", "720p", "480p", "360p", "240p"]:
+            self.quality_combo.addItem(quality, quality)
+        self.quality_combo.addItem("Audio only", streams.AUDIO_ONLY)
         self.quality_combo.setFont(QFont("Arial", 12))
         self.quality_combo.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 5px; border: 1px solid #3399FF; border-radius: 5px;")
 
+        self.audio_format_label = QLabel("Audio Format (for Audio only):")
+        self.audio_format_label.setFont(QFont("Arial", 14))
+        self.audio_format_label.setStyleSheet("color: #000000;")
+
+        self.audio_format_combo = QComboBox()
+        self.audio_format_combo.addItems(streams.AUDIO_FORMATS)
+        self.audio_format_combo.setFont(QFont("Arial", 12))
+        self.audio_format_combo.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 5px; border: 1px solid #3399FF; border-radius: 5px;")
+
         self.save_path_label = QLabel("Save to:")
         self.save_path_label.setFont(QFont("Arial", 14))
         self.save_path_label.setStyleSheet("color: #000000;")
@@ -116,12 +267,99 @@ class MainWindow(QMainWindow):
         self.save_path_layout.addWidget(self.save_path_input)
         self.save_path_layout.addWidget(self.browse_button)
 
+        self.workers_label = QLabel("Parallel Downloads:")
+        self.workers_label.setFont(QFont("Arial", 14))
+        self.workers_label.setStyleSheet("color: #000000;")
+
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 16)
+        self.workers_spin.setValue(4)
+        self.workers_spin.setFont(QFont("Arial", 12))
+        self.workers_spin.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 5px; border: 1px solid #3399FF; border-radius: 5px;")
+
+        self.transcode_workers_label = QLabel("Post-processing Workers:")
+        self.transcode_workers_label.setFont(QFont("Arial", 14))
+        self.transcode_workers_label.setStyleSheet("color: #000000;")
+
+        self.transcode_workers_spin = QSpinBox()
+        self.transcode_workers_spin.setRange(1, 64)
+        self.transcode_workers_spin.setValue(os.cpu_count() or 1)
+        self.transcode_workers_spin.setFont(QFont("Arial", 12))
+        self.transcode_workers_spin.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 5px; border: 1px solid #3399FF; border-radius: 5px;")
+
+        self.playlist_ttl_label = QLabel("Reuse Playlist Listings For (hours, 0 to always list again):")
+        self.playlist_ttl_label.setFont(QFont("Arial", 14))
+        self.playlist_ttl_label.setStyleSheet("color: #000000;")
+
+        self.playlist_ttl_spin = QSpinBox()
+        self.playlist_ttl_spin.setRange(0, 168)
+        self.playlist_ttl_spin.setValue(playlist_cache.DEFAULT_TTL // 3600)
+        self.playlist_ttl_spin.setFont(QFont("Arial", 12))
+        self.playlist_ttl_spin.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 5px; border: 1px solid #3399FF; border-radius: 5px;")
+
+        self.fallback_check = QCheckBox("Fall back to a lower quality when the selected one is unavailable")
+        self.fallback_check.setFont(QFont("Arial", 12))
+        self.fallback_check.setStyleSheet("color: #000000;")
+        self.fallback_check.setChecked(True)
+
+        self.sync_check = QCheckBox("Sync: only download videos that are new or changed")
+        self.sync_check.setFont(QFont("Arial", 12))
+        self.sync_check.setStyleSheet("color: #000000;")
+
+        self.prune_check = QCheckBox("Remove videos that are no longer in the playlist")
+        self.prune_check.setFont(QFont("Arial", 12))
+        self.prune_check.setStyleSheet("color: #000000;")
+
+        self.reuse_check = QCheckBox("Reuse videos already downloaded to other folders instead of downloading again")
+        self.reuse_check.setFont(QFont("Arial", 12))
+        self.reuse_check.setStyleSheet("color: #000000;")
+        self.reuse_check.setChecked(True)
+
+        self.stream_encode_check = QCheckBox("Enhance while downloading (videos that need re-encoding are never stored in their original form)")
+        self.stream_encode_check.setFont(QFont("Arial", 12))
+        self.stream_encode_check.setStyleSheet("color: #000000;")
+
+        self.bandwidth_label = QLabel("Bandwidth Limit (e.g. 2M per second, empty for unlimited):")
+        self.bandwidth_label.setFont(QFont("Arial", 14))
+        self.bandwidth_label.setStyleSheet("color: #000000;")
+
+        self.bandwidth_input = QLineEdit()
+        self.bandwidth_input.setFont(QFont("Arial", 12))
+        self.bandwidth_input.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 5px; border: 1px solid #3399FF; border-radius: 5px;")
+        self.bandwidth_input.editingFinished.connect(self.apply_bandwidth)
+
+        self.schedule_label = QLabel("Bandwidth Schedule (e.g. 09:00-18:00=2M,22:00-07:00=0):")
+        self.schedule_label.setFont(QFont("Arial", 14))
+        self.schedule_label.setStyleSheet("color: #000000;")
+
+        self.schedule_input = QLineEdit()
+        self.schedule_input.setFont(QFont("Arial", 12))
+        self.schedule_input.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 5px; border: 1px solid #3399FF; border-radius: 5px;")
+        self.schedule_input.editingFinished.connect(self.apply_bandwidth)
+
         self.form_layout.addWidget(self.url_label)
         self.form_layout.addWidget(self.url_input)
         self.form_layout.addWidget(self.quality_label)
         self.form_layout.addWidget(self.quality_combo)
+        self.form_layout.addWidget(self.audio_format_label)
+        self.form_layout.addWidget(self.audio_format_combo)
+        self.form_layout.addWidget(self.fallback_check)
         self.form_layout.addWidget(self.save_path_label)
         self.form_layout.addLayout(self.save_path_layout)
+        self.form_layout.addWidget(self.sync_check)
+        self.form_layout.addWidget(self.prune_check)
+        self.form_layout.addWidget(self.reuse_check)
+        self.form_layout.addWidget(self.stream_encode_check)
+        self.form_layout.addWidget(self.workers_label)
+        self.form_layout.addWidget(self.workers_spin)
+        self.form_layout.addWidget(self.transcode_workers_label)
+        self.form_layout.addWidget(self.transcode_workers_spin)
+        self.form_layout.addWidget(self.playlist_ttl_label)
+        self.form_layout.addWidget(self.playlist_ttl_spin)
+        self.form_layout.addWidget(self.bandwidth_label)
+        self.form_layout.addWidget(self.bandwidth_input)
+        self.form_layout.addWidget(self.schedule_label)
+        self.form_layout.addWidget(self.schedule_input)
 
         self.download_button = QPushButton("Download Playlist")
         self.download_button.setFont(QFont("Arial", 14))
@@ -138,6 +376,94 @@ class MainWindow(QMainWindow):
         """)
         self.download_button.clicked.connect(self.start_download)
 
+        self.preview_layout = QHBoxLayout()
+        self.preview_button = QPushButton("Preview Playlist")
+        self.select_all_button = QPushButton("Select All")
+        self.select_none_button = QPushButton("Select None")
+        for button in (self.preview_button, self.select_all_button, self.select_none_button):
+            button.setFont(QFont("Arial", 12))
+            button.setStyleSheet("""
+                QPushButton {
+                    background-color: #3399FF;
+                    color: #FFFFFF;
+                    padding: 5px 10px;
+                    border: 1px solid #3399FF;
+                    border-radius: 5px;
+                }
+                QPushButton:hover {
+                    background-color: #0066CC;
+                }
+            """)
+            self.preview_layout.addWidget(button)
+        self.preview_button.clicked.connect(self.start_preview)
+        self.select_all_button.clicked.connect(lambda: self.preview_model and self.preview_model.set_all(True))
+        self.select_none_button.clicked.connect(lambda: self.preview_model and self.preview_model.set_all(False))
+
+        # Fixed row heights let the view skip measuring rows it never shows
+        self.preview_table = QTableView()
+        self.preview_table.verticalHeader().setVisible(False)
+        self.preview_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.preview_table.verticalHeader().setDefaultSectionSize(24)
+        self.preview_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.preview_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.preview_table.setStyleSheet("background-color: #F0F8FF; color: #000000; border: 1px solid #3399FF; border-radius: 5px;")
+        self.preview_table.verticalScrollBar().valueChanged.connect(self.update_preview_rows)
+
+        self.queue_layout = QHBoxLayout()
+        self.priority_label = QLabel("Priority:")
+        self.priority_label.setFont(QFont("Arial", 12))
+        self.priority_label.setStyleSheet("color: #000000;")
+
+        self.priority_spin = QSpinBox()
+        self.priority_spin.setRange(0, 10)
+        self.priority_spin.setFont(QFont("Arial", 12))
+        self.priority_spin.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 5px; border: 1px solid #3399FF; border-radius: 5px;")
+
+        self.queue_button = QPushButton("Add to Queue")
+        self.queue_button.setFont(QFont("Arial", 12))
+        self.queue_button.setStyleSheet("""
+            QPushButton {
+                background-color: #3399FF;
+                color: #FFFFFF;
+                padding: 5px 10px;
+                border: 1px solid #3399FF;
+                border-radius: 5px;
+            }
+            QPushButton:hover {
+                background-color: #0066CC;
+            }
+        """)
+        self.queue_button.clicked.connect(self.enqueue_download)
+        self.queue_layout.addWidget(self.priority_label)
+        self.queue_layout.addWidget(self.priority_spin)
+        self.queue_layout.addWidget(self.queue_button)
+
+        self.queue_table = QTableWidget(0, 5)
+        self.queue_table.setHorizontalHeaderLabels(["Job", "URL", "Priority", "State", "Progress"])
+        self.queue_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.queue_table.verticalHeader().setVisible(False)
+        self.queue_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.queue_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.queue_table.setStyleSheet("background-color: #F0F8FF; color: #000000; border: 1px solid #3399FF; border-radius: 5px;")
+
+        self.job_buttons_layout = QHBoxLayout()
+        for text, slot in (("Pause Job", self.pause_job), ("Resume Job", self.resume_job), ("Cancel Job", self.cancel_job)):
+            button = QPushButton(text)
+            button.setFont(QFont("Arial", 12))
+            button.setStyleSheet("""
+                QPushButton {
+                    background-color: #3399FF;
+                    color: #FFFFFF;
+                    padding: 5px 10px;
+                    border-radius: 5px;
+                }
+                QPushButton:hover {
+                    background-color: #0066CC;
+                }
+            """)
+            button.clicked.connect(slot)
+            self.job_buttons_layout.addWidget(button)
+
         self.stop_button = QPushButton("Stop Download")
         self.stop_button.setFont(QFont("Arial", 14))
         self.stop_button.setStyleSheet("""
@@ -170,6 +496,21 @@ class MainWindow(QMainWindow):
         self.resume_button.setEnabled(False)
         self.resume_button.clicked.connect(self.resume_download)
 
+        self.retry_button = QPushButton("Retry Failed")
+        self.retry_button.setFont(QFont("Arial", 14))
+        self.retry_button.setStyleSheet("""
+            QPushButton {
+                background-color: #3399FF;
+                color: #FFFFFF;
+                padding: 10px;
+                border-radius: 5px;
+            }
+            QPushButton:hover {
+                background-color: #0066CC;
+            }
+        """)
+        self.retry_button.clicked.connect(self.retry_failed)
+
         self.progress_bar = QProgressBar()
         self.progress_bar.setStyleSheet("""
             QProgressBar {
@@ -184,8 +525,18 @@ class MainWindow(QMainWindow):
             }
         """)
 
-        self.log_window = QTextEdit()
+        self.stats_label = QLabel("")
+        self.stats_label.setFont(QFont("Arial", 12))
+        self.stats_label.setStyleSheet("color: #000000;")
+
+        self.transcode_label = QLabel("")
+        self.transcode_label.setFont(QFont("Arial", 12))
+        self.transcode_label.setStyleSheet("color: #000000;")
+
+        self.log_window = QPlainTextEdit()
         self.log_window.setReadOnly(True)
+        # Oldest lines are dropped once the view holds this many
+        self.log_window.setMaximumBlockCount(logsink.MAX_LINES)
         self.log_window.setStyleSheet("background-color: #F0F8FF; color: #000000; padding: 10px; border: 1px solid #3399FF; border-radius: 5px;")
 
         self.clear_log_button = QPushButton("Clear Log")
@@ -203,6 +554,19 @@ class MainWindow(QMainWindow):
         """)
         self.clear_log_button.clicked.connect(self.clear_log)
 
+        self.log_level_layout = QHBoxLayout()
+        self.log_level_label = QLabel("Show in Log:")
+        self.log_level_label.setFont(QFont("Arial", 12))
+        self.log_level_label.setStyleSheet("color: #000000;")
+
+        self.log_level_combo = QComboBox()
+        self.log_level_combo.addItems(list(logsink.LEVELS))
+        self.log_level_combo.setCurrentText("Info")
+        self.log_level_combo.setFont(QFont("Arial", 12))
+        self.log_level_combo.currentTextChanged.connect(self.set_log_level)
+        self.log_level_layout.addWidget(self.log_level_label)
+        self.log_level_layout.addWidget(self.log_level_combo)
+
         self.creator_layout = QHBoxLayout()
         self.creator_label = QLabel('Created By <a href="https://github.com/wasimtikki120" style="color: #FF4500; text-decoration: none;">Mohammad Wasim Tikki</a>')
         self.creator_label.setFont(QFont("Arial", 12))
@@ -220,10 +584,19 @@ class MainWindow(QMainWindow):
 
         self.main_layout.addWidget(self.header)
         self.main_layout.addLayout(self.form_layout)
+        self.main_layout.addLayout(self.preview_layout)
+        self.main_layout.addWidget(self.preview_table)
         self.main_layout.addWidget(self.download_button)
         self.main_layout.addWidget(self.stop_button)
         self.main_layout.addWidget(self.resume_button)
+        self.main_layout.addWidget(self.retry_button)
+        self.main_layout.addLayout(self.queue_layout)
+        self.main_layout.addWidget(self.queue_table)
+        self.main_layout.addLayout(self.job_buttons_layout)
         self.main_layout.addWidget(self.progress_bar)
+        self.main_layout.addWidget(self.stats_label)
+        self.main_layout.addWidget(self.transcode_label)
+        self.main_layout.addLayout(self.log_level_layout)
         self.main_layout.addWidget(self.log_window)
         self.main_layout.addWidget(self.clear_log_button)
         self.main_layout.addLayout(self.creator_layout)
@@ -266,10 +639,11 @@ class MainWindow(QMainWindow):
         folder = QFileDialog.getExistingDirectory(self, "Select Folder")
         if folder:
             self.save_path_input.setText(folder)
+            self.resume_button.setEnabled(os.path.exists(os.path.join(folder, journal.JOURNAL_NAME)))
 
     def start_download(self):
         playlist_url = self.url_input.text()
-        quality = self.quality_combo.currentText()
+        quality = self.quality_combo.currentData()
         save_path = self.save_path_input.text()
 
         if not playlist_url:
@@ -280,14 +654,74 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Please select a folder to save videos")
             return
 
+        self.launch_download(playlist_url, quality, save_path)
+
+    def start_preview(self):
+        playlist_url = self.url_input.text()
+        if not playlist_url:
+            QMessageBox.warning(self, "Error", "Please enter a playlist URL")
+            return
+        if self.preview_loader:
+            self.preview_loader.stop()
+        self.preview_url = playlist_url
+        self.preview_loader = preview.PreviewLoader(
+            playlist_url, self.save_path_input.text() or None, self.quality_combo.currentData(),
+            playlist_ttl=self.playlist_ttl_spin.value() * 3600,
+            on_rows=self.preview_signals.rows.emit,
+            on_loaded=self.preview_signals.loaded.emit,
+            on_error=self.preview_signals.error.emit
+        )
+        self.preview_model = PreviewModel(self.preview_loader, self)
+        self.preview_table.setModel(self.preview_model)
+        self.preview_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.preview_loader.start()
+
+    def add_preview_rows(self, count):
+        self.preview_model.add_rows(count)
+        self.update_preview_rows()
+
+    def update_preview_rows(self, *args):
+        # Only the rows on screen (and a few below) get their metadata fetched
+        if not self.preview_model or not self.preview_model.rows:
+            return
+        first = max(0, self.preview_table.rowAt(0))
+        last = self.preview_table.rowAt(self.preview_table.viewport().height() - 1)
+        if last < 0:
+            last = self.preview_model.rows - 1
+        self.preview_loader.show(first, last)
+
+    def preview_options(self, playlist_url):
+        # The preview's ticks only apply to the playlist it was opened for
+        if self.preview_model and playlist_url == self.preview_url:
+            return self.preview_model.engine_options()
+        return {}
+
+    def launch_download(self, playlist_url, quality, save_path, retry_failed=False):
         self.download_button.setEnabled(False)
         self.stop_button.setEnabled(True)
         self.resume_button.setEnabled(False)
-        self.download_thread = DownloadThread(playlist_url, quality, save_path)
+        self.ensure_transcode_pool()
+        self.download_path = save_path
+        self.download_thread = DownloadThread(
+            playlist_url, quality, save_path,
+            max_workers=self.workers_spin.value(),
+            fallback=self.fallback_check.isChecked(),
+            sync=self.sync_check.isChecked(),
+            prune=self.prune_check.isChecked(),
+            reuse_copies=self.reuse_check.isChecked(),
+            stream_encode=self.stream_encode_check.isChecked(),
+            audio_format=self.audio_format_combo.currentText(),
+            audio_workers=self.transcode_workers_spin.value(),
+            playlist_ttl=self.playlist_ttl_spin.value() * 3600,
+            retry_failed=retry_failed,
+            **self.preview_options(playlist_url)
+        )
         self.download_thread.progress.connect(self.update_progress)
-        self.download_thread.log.connect(self.update_log)
+        self.download_thread.log.connect(self.update_download_log)
         self.download_thread.finished.connect(self.download_finished)
-        self.download_thread.resume_download.connect(self.set_resume_index)
+        self.download_thread.error.connect(self.download_failed)
+        self.download_thread.videos_found.connect(self.update_videos_found)
+        self.download_thread.stats.connect(self.update_stats)
         self.download_thread.video_downloaded.connect(self.enhance_video)  # Connect signal to enhance video
         self.download_thread.start()
 
@@ -298,52 +732,190 @@ class MainWindow(QMainWindow):
             self.resume_button.setEnabled(True)
 
     def resume_download(self):
-        if self.download_thread:
+        # The journal in the save folder remembers finished videos of that playlist, so this starts
+        # over at the first unfinished one, also after a restart or with another URL entered
+        if self.url_input.text() and self.save_path_input.text():
             playlist_url = self.url_input.text()
-            quality = self.quality_combo.currentText()
+            quality = self.quality_combo.currentData()
             save_path = self.save_path_input.text()
+            self.launch_download(playlist_url, quality, save_path)
 
-            self.download_button.setEnabled(False)
-            self.stop_button.setEnabled(True)
-            self.resume_button.setEnabled(False)
-            self.download_thread = DownloadThread(playlist_url, quality, save_path, start_index=self.resume_index)
-            self.download_thread.progress.connect(self.update_progress)
-            self.download_thread.log.connect(self.update_log)
-            self.download_thread.finished.connect(self.download_finished)
-            self.download_thread.resume_download.connect(self.set_resume_index)
-            self.download_thread.video_downloaded.connect(self.enhance_video)  # Connect signal to enhance video
-            self.download_thread.start()
-
-    def set_resume_index(self, index):
-        self.resume_index = index
+    def retry_failed(self):
+        playlist_url = self.url_input.text()
+        save_path = self.save_path_input.text()
+        if not playlist_url or not save_path:
+            QMessageBox.warning(self, "Error", "Please enter a playlist URL and select its folder")
+            return
+        self.launch_download(playlist_url, self.quality_combo.currentData(), save_path, retry_failed=True)
 
     def update_progress(self, value):
         self.progress_bar.setValue(value)
 
-    def update_log(self, message):
-        self.log_window.append(message)
+    def update_stats(self, stats):
+        self.stats_label.setText(
+            f"Speed: {progress.format_rate(stats['rate'])} (avg {progress.format_rate(stats['average_rate'])})"
+            f" · ETA {progress.format_eta(stats['eta'])} · {stats['active']} active"
+        )
+
+    def update_videos_found(self, count):
+        self.progress_bar.setFormat(f"%p% of {count} videos")
+
+    def update_log(self, message, save_path=None, level=None):
+        self.log_sink.write(message, level, save_path)
+
+    def update_download_log(self, message):
+        self.update_log(message, self.download_path)
+
+    def update_job_log(self, job_id, message):
+        self.update_log(f"[Job {job_id}] {message}", self.job_paths.get(job_id), logsink.level_of(message))
+
+    def flush_log(self):
+        lines, dropped = self.log_sink.drain()
+        if dropped:
+            lines.insert(0, f"... {dropped} earlier lines not shown (see {logsink.LOG_NAME} in the save folder)")
+        if lines:
+            self.log_window.appendPlainText("\n".join(lines))
+
+    def set_log_level(self, name):
+        self.log_sink.view_level = logsink.LEVELS[name]
 
     def clear_log(self):
+        self.log_sink.drain()
         self.log_window.clear()
 
-    def enhance_video(self, video_path):
+    def apply_bandwidth(self):
+        # Takes effect immediately for every running download, including queued jobs
         try:
-            if not os.path.exists(video_path):
-                self.update_log(f"Error: Video file not found at {video_path}")
-                return
+            rate = network.parse_rate(self.bandwidth_input.text()) if self.bandwidth_input.text().strip() else None
+            schedule = network.BandwidthSchedule.parse(self.schedule_input.text())
+        except ValueError:
+            QMessageBox.warning(self, "Error", "Invalid bandwidth limit or schedule")
+            return
+        network.LIMITER.set_rate(rate)
+        network.LIMITER.set_schedule(schedule)
+
+    def ensure_transcode_pool(self):
+        workers = self.transcode_workers_spin.value()
+        if self.transcode_pool and self.transcode_pool.size == workers:
+            return
+        if self.transcode_pool:
+            self.transcode_pool.shutdown(wait=False)
+        self.transcode_pool = postprocess.TranscodePool(
+            workers,
+            on_progress=self.transcode_signals.progress.emit,
+            on_done=self.record_transcode,
+            on_log=self.transcode_signals.log.emit
+        )
+
+    def record_transcode(self, video_path, action, error):
+        # Called on a pool worker thread: rewritten files get their manifest size and hash refreshed there
+        if not error and action != postprocess.SKIP:
+            try:
+                manifest.refresh_file(video_path)
+            except Exception as e:
+                error = e
+        self.transcode_signals.done.emit(video_path, action or "", str(error) if error else "")
+
+    def enhance_video(self, video_path, run_metrics=None):
+        # Runs in the transcode pool so downloads and the UI never wait on ffmpeg
+        if os.path.splitext(video_path)[1].lstrip(".") in streams.AUDIO_FORMATS:
+            return
+        self.ensure_transcode_pool()
+        self.transcode_pool.submit(video_path, run_metrics)
+
+    def update_transcode_progress(self, video_path, percent):
+        self.transcode_label.setText(
+            f"Enhancing {os.path.basename(video_path)}: {percent}% ({self.transcode_pool.pending()} queued)"
+        )
+
+    def transcode_finished(self, video_path, action, error):
+        save_path = os.path.dirname(video_path)
+        if error:
+            self.update_log(f"Enhancement error: {error}", save_path)
+        elif action == postprocess.SKIP:
+            self.update_log(f"Already 1080p, skipped enhancement of: {os.path.basename(video_path)}", save_path)
+        elif action == postprocess.REMUX:
+            self.update_log(f"Remuxed without re-encoding: {os.path.basename(video_path)}", save_path)
+        else:
+            self.update_log(f"Enhanced quality of: {os.path.basename(video_path)}", save_path)
+        if not self.transcode_pool.busy():
+            self.transcode_label.setText("")
+
+    def enqueue_download(self):
+        url = self.url_input.text()
+        save_path = self.save_path_input.text()
 
-            # Set the output path for the enhanced video
-            output_path = os.path.splitext(video_path)[0] + "_enhanced.mp4"
+        if not url:
+            QMessageBox.warning(self, "Error", "Please enter a playlist URL")
+            return
 
-            # Use ffmpeg to upscale the video to 1080p
-            ffmpeg.input(video_path).output(
-                output_path, vf='scale=1920:1080', vcodec='libx264', acodec='aac'
-            ).run(overwrite_output=True)
+        if not save_path:
+            QMessageBox.warning(self, "Error", "Please select a folder to save videos")
+            return
 
-            os.replace(output_path, video_path)
-            self.update_log(f"Enhanced quality of: {os.path.basename(video_path)}")
-        except Exception as e:
-            self.update_log(f"Enhancement error: {e}")
+        self.scheduler.add(
+            url, self.quality_combo.currentData(), save_path,
+            priority=self.priority_spin.value(),
+            fallback=self.fallback_check.isChecked(),
+            sync=self.sync_check.isChecked(),
+            prune=self.prune_check.isChecked(),
+            reuse_copies=self.reuse_check.isChecked(),
+            stream_encode=self.stream_encode_check.isChecked(),
+            audio_format=self.audio_format_combo.currentText(),
+            audio_workers=self.transcode_workers_spin.value(),
+            playlist_ttl=self.playlist_ttl_spin.value() * 3600,
+            **self.preview_options(url)
+        )
+        self.ensure_transcode_pool()
+
+    def refresh_queue(self):
+        self.queue_table.setRowCount(0)
+        self.job_rows = {}
+        for job in self.scheduler.store.all():
+            row = self.queue_table.rowCount()
+            self.queue_table.insertRow(row)
+            self.job_rows[job["id"]] = row
+            self.job_paths[job["id"]] = job["save_path"]
+            for column, value in enumerate((job["id"], job["url"], job["priority"], job["state"], "")):
+                self.queue_table.setItem(row, column, QTableWidgetItem(str(value)))
+
+    def update_job_state(self, job_id, state):
+        if job_id not in self.job_rows:
+            self.refresh_queue()
+        self.queue_table.item(self.job_rows[job_id], 3).setText(state)
+        if state == jobs.RUNNING:
+            self.ensure_transcode_pool()
+
+    def update_job_progress(self, job_id, percent):
+        if job_id in self.job_rows:
+            self.queue_table.item(self.job_rows[job_id], 4).setText(f"{percent}%")
+
+    def selected_jobs(self):
+        rows = {index.row() for index in self.queue_table.selectionModel().selectedRows()}
+        return [job_id for job_id, row in self.job_rows.items() if row in rows]
+
+    def pause_job(self):
+        for job_id in self.selected_jobs():
+            self.scheduler.pause(job_id)
+
+    def resume_job(self):
+        for job_id in self.selected_jobs():
+            self.scheduler.resume(job_id)
+
+    def cancel_job(self):
+        for job_id in self.selected_jobs():
+            self.scheduler.cancel(job_id)
+
+    def closeEvent(self, event):
+        # Running jobs go back to the queue and continue from their journal next time
+        self.scheduler.shutdown()
+        if self.preview_loader:
+            self.preview_loader.stop()
+        if self.download_thread:
+            self.download_thread.stop()
+        self.flush_log()
+        self.log_sink.close()
+        super().closeEvent(event)
 
     def download_finished(self):
         QMessageBox.information(self, "Done", "All videos have been downloaded!")
@@ -351,6 +923,13 @@ class MainWindow(QMainWindow):
         self.stop_button.setEnabled(False)
         self.resume_button.setEnabled(False)
 
+    def download_failed(self, message):
+        self.update_download_log(message)
+        QMessageBox.warning(self, "Error", message)
+        self.download_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.resume_button.setEnabled(os.path.exists(os.path.join(self.download_path, journal.JOURNAL_NAME)))
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainWindow()
@@ -0,0 +1,57 @@
+import json
+import os
+import time
+from urllib.parse import urlparse
+
+CACHE_NAME = ".wt_playlist_cache.json"
+DEFAULT_TTL = 6 * 60 * 60
+
+
+def read_cache(save_path):
+    try:
+        with open(os.path.join(save_path, CACHE_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load(save_path, playlist_url, ttl=DEFAULT_TTL):
+    entry = read_cache(save_path).get(playlist_url)
+    if not entry or time.time() - entry["fetched"] > ttl:
+        return None
+    return entry["video_urls"]
+
+
+def store(save_path, playlist_url, video_urls):
+    cache = read_cache(save_path)
+    cache[playlist_url] = {"fetched": time.time(), "video_urls": video_urls}
+    path = os.path.join(save_path, CACHE_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(cache, f)
+    os.replace(path + ".tmp", path)
+
+
+def is_playlist(url):
+    return "list=" in urlparse(url).query
+
+
+def iter_video_urls(playlist_url, save_path, ttl=DEFAULT_TTL):
+    # Yields URLs as soon as each continuation page arrives; the listing is only
+    # cached once it has been enumerated to the end, and only if there is a folder to cache it in
+    if not is_playlist(playlist_url):
+        # A single video is a playlist of one
+        yield playlist_url
+        return
+
+    cached = load(save_path, playlist_url, ttl) if save_path else None
+    if cached is not None:
+        yield from cached
+        return
+
+    from pytube import Playlist
+    video_urls = []
+    for video_url in Playlist(playlist_url).url_generator():
+        video_urls.append(video_url)
+        yield video_url
+    if save_path:
+        store(save_path, playlist_url, video_urls)
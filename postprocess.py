@@ -0,0 +1,294 @@
+import json
+import os
+import queue
+import subprocess
+import threading
+
+import diskspace
+import metrics
+
+TARGET_WIDTH = 1920
+TARGET_HEIGHT = 1080
+TARGET_VCODEC = "h264"
+TARGET_ACODEC = "aac"
+
+SKIP = "skip"
+REMUX = "remux"
+ENCODE = "encode"
+
+ENCODE_ARGS = ["-vf", f"scale={TARGET_WIDTH}:{TARGET_HEIGHT}", "-c:v", "libx264", "-c:a", "aac"]
+# Upscaling to 1080p can leave the encoded file well above the source size
+ENCODE_GROWTH = 2
+
+
+class EncodeError(RuntimeError):
+    pass
+
+
+class TranscodeCancelled(Exception):
+    pass
+
+
+def probe(video_path):
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", video_path],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffprobe exited with code {result.returncode}")
+    info = json.loads(result.stdout)
+    streams = info.get("streams", [])
+    # Cover art shows up as a one-frame video stream; it is not the video
+    video = next((s for s in streams if s.get("codec_type") == "video"
+                  and not s.get("disposition", {}).get("attached_pic")), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    return {
+        "duration": float(info.get("format", {}).get("duration") or 0),
+        "format": info.get("format", {}).get("format_name", ""),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "vcodec": video.get("codec_name"),
+        "acodec": audio.get("codec_name"),
+    }
+
+
+def plan(info):
+    # Decide the cheapest way to get a 1080p H.264/AAC mp4 out of the probed file
+    if not info["vcodec"]:
+        return SKIP, []  # Audio-only downloads have nothing to enhance
+    if (info["width"], info["height"]) != (TARGET_WIDTH, TARGET_HEIGHT) or info["vcodec"] != TARGET_VCODEC:
+        return ENCODE, ENCODE_ARGS
+    audio_ok = info["acodec"] in (None, TARGET_ACODEC)
+    if audio_ok and "mp4" in info["format"].split(","):
+        return SKIP, []
+    return REMUX, ["-c:v", "copy", "-c:a", "copy" if audio_ok else "aac"]
+
+
+def report_progress(line, duration, on_progress):
+    key, _, value = line.strip().partition("=")
+    if key == "out_time_us" and duration and on_progress and value.isdigit():
+        on_progress(min(100, int(int(value) / 1e6 / duration * 100)))
+    elif key == "progress" and value == "end" and on_progress:
+        on_progress(100)
+
+
+def run_ffmpeg(input_args, output_args, output_path, duration=0, on_progress=None):
+    # -progress writes key=value blocks to stdout that we turn into a percentage
+    process = subprocess.Popen(
+        ["ffmpeg", "-y", "-nostdin", "-hide_banner", "-loglevel", "error", "-nostats",
+         *input_args, *output_args, "-progress", "pipe:1", output_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    for line in process.stdout:
+        report_progress(line, duration, on_progress)
+    error = process.stderr.read()
+    if process.wait() != 0:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise RuntimeError(error.strip() or f"ffmpeg exited with code {process.returncode}")
+
+
+def mux(video_path, audio_path, output_path):
+    # Lossless: both adaptive tracks are stream-copied into a single mp4
+    muxing_path = os.path.splitext(output_path)[0] + "_muxing.mp4"
+    run_ffmpeg(["-i", video_path, "-i", audio_path], ["-map", "0:v:0", "-map", "1:a:0", "-c", "copy"], muxing_path)
+    os.replace(muxing_path, output_path)
+    os.remove(video_path)
+    os.remove(audio_path)
+    return output_path
+
+
+def audio_codec_args(source_codec, audio_format):
+    # Stream-copy whenever the target container can hold the source codec
+    source_codec = source_codec or ""
+    if audio_format == "m4a":
+        return ["-c:a", "copy"] if source_codec.startswith("mp4a") else ["-c:a", "aac", "-b:a", "192k"]
+    if audio_format == "opus":
+        return ["-c:a", "copy"] if source_codec == "opus" else ["-c:a", "libopus", "-b:a", "128k"]
+    return ["-c:a", "libmp3lame", "-q:a", "2"]
+
+
+def extract_audio(input_path, output_path, audio_format, source_codec=None, tags=None, cover_path=None,
+                  duration=0, on_progress=None):
+    # Ogg/Opus cannot carry cover art through ffmpeg, so the cover is only embedded in m4a and mp3
+    with_cover = cover_path and audio_format != "opus"
+    input_args = ["-i", input_path] + (["-i", cover_path] if with_cover else [])
+    output_args = ["-map", "0:a:0", *audio_codec_args(source_codec, audio_format)]
+    if with_cover:
+        output_args += ["-map", "1:v:0", "-c:v", "mjpeg", "-disposition:v:0", "attached_pic"]
+    if audio_format == "mp3":
+        output_args += ["-id3v2_version", "3"]
+    for key, value in (tags or {}).items():
+        output_args += ["-metadata", f"{key}={value}"]
+    converting_path = os.path.splitext(output_path)[0] + f"_converting.{audio_format}"
+    run_ffmpeg(input_args, output_args, converting_path, duration, on_progress)
+    os.replace(converting_path, output_path)
+    return output_path
+
+
+def needs_encode(stream):
+    # Known from the stream metadata alone: anything that is not already 1080p H.264
+    # would be re-encoded by enhance() once downloaded
+    return (stream.resolution != f"{TARGET_HEIGHT}p"
+            or not (getattr(stream, "video_codec", None) or "").startswith("avc1"))
+
+
+class StreamingEncoder:
+    # Encodes while the download is still arriving: chunks are written to ffmpeg's
+    # stdin and the finished file is moved into place, so the original stream never
+    # touches the disk. Only single-file (progressive) streams can be fed this way.
+    def __init__(self, output_path, duration=0, on_progress=None):
+        self.output_path = output_path
+        self.encoding_path = os.path.splitext(output_path)[0] + "_enhanced.mp4"
+        self.errors = []
+        try:
+            self.process = subprocess.Popen(
+                ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-nostats",
+                 "-i", "pipe:0", *ENCODE_ARGS, "-progress", "pipe:1", self.encoding_path],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+            )
+        except OSError as e:
+            # e.g. ffmpeg is not installed; callers fall back to downloading first
+            raise EncodeError(f"Could not start ffmpeg: {e}")
+        self.reader = threading.Thread(target=self.read_output, args=(duration, on_progress), daemon=True)
+        self.reader.start()
+
+    def read_output(self, duration, on_progress):
+        # Drained on its own thread so ffmpeg never blocks on a full stdout pipe
+        for raw in self.process.stdout:
+            line = raw.decode(errors="replace")
+            if "=" in line:
+                report_progress(line, duration, on_progress)
+            elif line.strip():
+                self.errors.append(line.strip())
+
+    def fail(self, message):
+        self.abort()
+        raise EncodeError("\n".join(self.errors) or message)
+
+    def write(self, chunk):
+        try:
+            self.process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            self.reader.join()
+            self.fail(f"ffmpeg exited with code {self.process.wait()}")
+
+    def finish(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.reader.join()
+        if self.process.wait() != 0:
+            self.fail(f"ffmpeg exited with code {self.process.returncode}")
+        os.replace(self.encoding_path, self.output_path)
+        return self.output_path
+
+    def abort(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+        if os.path.exists(self.encoding_path):
+            os.remove(self.encoding_path)
+
+
+def enhance(video_path, on_progress=None, min_free=diskspace.MIN_FREE, check=None, on_wait=None):
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video file not found at {video_path}")
+
+    info = probe(video_path)
+    action, output_args = plan(info)
+    if action == SKIP:
+        return action
+
+    # Set the output path for the enhanced video
+    output_path = os.path.splitext(video_path)[0] + "_enhanced.mp4"
+    # The source stays on disk until the enhanced copy replaces it
+    size = os.path.getsize(video_path)
+    needed = size * ENCODE_GROWTH if action == ENCODE else size
+    with diskspace.for_path(os.path.dirname(os.path.abspath(video_path))).reserve(needed, min_free, check, on_wait):
+        run_ffmpeg(["-i", video_path], output_args, output_path, info["duration"], on_progress)
+    os.replace(output_path, video_path)
+    return action
+
+
+class TranscodePool:
+    # Worker threads that each drive one ffmpeg subprocess at a time, fed from a queue
+    def __init__(self, workers=None, on_progress=None, on_done=None, min_free=diskspace.MIN_FREE, on_log=None):
+        self.size = max(1, workers or os.cpu_count() or 1)
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.min_free = min_free or 0
+        self.on_log = on_log
+        self.closing = False
+        self.jobs = queue.Queue()
+        self.running = 0
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(self.size)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, video_path, run_metrics=None):
+        # run_metrics: the download run's Metrics, so enhancing shows up in its summary
+        self.jobs.put((video_path, run_metrics))
+
+    def pending(self):
+        return self.jobs.qsize()
+
+    def busy(self):
+        with self.lock:
+            return self.running + self.pending()
+
+    def check_open(self):
+        # A job still waiting for disk space when the pool shuts down fails instead of blocking it
+        if self.closing:
+            raise TranscodeCancelled("Transcode pool shut down while waiting for disk space")
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            video_path, run_metrics = job
+            recorder = run_metrics or metrics.REGISTRY
+            with self.lock:
+                self.running += 1
+            try:
+                progress = (lambda percent: self.on_progress(video_path, percent)) if self.on_progress else None
+                with recorder.span("enhance", video_path):
+                    action = enhance(video_path, progress, self.min_free, self.check_open, self.on_log)
+                recorder.add(f"enhance_{action}")
+                error = None
+            except Exception as e:
+                action = None
+                error = e
+                recorder.add("enhance_failures")
+            with self.lock:
+                self.running -= 1
+            try:
+                recorder.rewrite_summary()
+            except OSError as e:
+                if self.on_log:
+                    self.on_log(f"Error writing metrics: {e}")
+            if self.on_done:
+                try:
+                    self.on_done(video_path, action, error)
+                except Exception as e:
+                    # A failing callback must not take the worker thread down with it
+                    if self.on_log:
+                        self.on_log(f"Enhancement error: {video_path}: {e}")
+
+    def shutdown(self, wait=True):
+        # Sentinels queue up behind outstanding jobs, so those still finish unless they
+        # are stuck waiting for disk space
+        self.closing = True
+        diskspace.wake_waiters()
+        for _ in self.threads:
+            self.jobs.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
@@ -0,0 +1,135 @@
+import threading
+
+import downloader
+import manifest
+import metadata_cache
+import playlist_cache
+import streams
+
+ROWS_BATCH = 200
+LOOKAHEAD = 20
+
+
+def quality_order(resolution):
+    ladder = streams.QUALITY_LADDER
+    return ladder.index(resolution) if resolution in ladder else len(ladder)
+
+
+class PreviewLoader:
+    # Lists a playlist in the background and fetches metadata only for the rows the
+    # user is looking at, so a preview of thousands of videos costs a page of requests.
+    # Reports through plain callbacks like the download engine.
+    def __init__(self, playlist_url, save_path=None, quality="1080p", workers=4,
+                 playlist_ttl=playlist_cache.DEFAULT_TTL, metadata_ttl=metadata_cache.DEFAULT_TTL,
+                 on_rows=downloader.ignore, on_loaded=downloader.ignore, on_error=downloader.ignore):
+        self.playlist_url = playlist_url
+        self.save_path = save_path
+        self.quality_ladder = streams.fallback_ladder(quality)
+        self.workers = max(1, workers)
+        self.playlist_ttl = playlist_ttl
+        self.metadata_ttl = metadata_ttl
+        self.on_rows = on_rows
+        self.on_loaded = on_loaded
+        self.on_error = on_error
+        self.urls = []
+        self.info = {}
+        self.loading = set()
+        self.wanted = []
+        self.condition = threading.Condition()
+        self.metadata_cache = None
+        self._is_running = True
+
+    def start(self):
+        self.metadata_cache = metadata_cache.MetadataCache(ttl=self.metadata_ttl) if self.metadata_ttl else None
+        threading.Thread(target=self.list_playlist, daemon=True).start()
+        for _ in range(self.workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def stop(self):
+        with self.condition:
+            self._is_running = False
+            self.condition.notify_all()
+
+    def url(self, row):
+        with self.condition:
+            return self.urls[row]
+
+    def row_info(self, row):
+        with self.condition:
+            return self.info.get(row)
+
+    def show(self, first, last):
+        # The visible rows (plus a little lookahead) replace whatever was wanted before,
+        # so rows scrolled past quickly are never fetched
+        with self.condition:
+            end = min(len(self.urls), last + 1 + LOOKAHEAD)
+            self.wanted = [row for row in range(max(0, first), end) if row not in self.info and row not in self.loading]
+            self.condition.notify_all()
+
+    def list_playlist(self):
+        try:
+            for video_url in playlist_cache.iter_video_urls(self.playlist_url, self.save_path, self.playlist_ttl):
+                if not self._is_running:
+                    return
+                with self.condition:
+                    self.urls.append(video_url)
+                    count = len(self.urls)
+                if count % ROWS_BATCH == 0:
+                    self.on_rows(count)
+        except Exception as e:
+            if self._is_running:
+                self.on_error(f"Error listing playlist: {e}")
+        with self.condition:
+            count = len(self.urls)
+        if self._is_running:
+            self.on_rows(count)
+
+    def work(self):
+        while True:
+            with self.condition:
+                while self._is_running and not self.wanted:
+                    self.condition.wait()
+                if not self._is_running:
+                    return
+                row = self.wanted.pop(0)
+                self.loading.add(row)
+                video_url = self.urls[row]
+            try:
+                info = self.describe(video_url)
+            except Exception as e:
+                info = {"title": f"Error: {e}", "length": None, "qualities": [], "resolution": None, "size": None}
+            with self.condition:
+                self.info[row] = info
+                self.loading.discard(row)
+                # A stopped loader's model has been replaced; its rows mean nothing now
+                if not self._is_running:
+                    return
+            self.on_loaded(row)
+
+    def describe(self, video_url):
+        vid = manifest.video_id(video_url)
+        yt = self.metadata_cache.get(vid, video_url) if self.metadata_cache else None
+        if yt is None:
+            from pytube import YouTube
+            yt = YouTube(video_url)
+            available = yt.streams
+            if self.metadata_cache:
+                self.metadata_cache.put(vid, yt, available)
+        else:
+            available = yt.streams
+
+        resolutions = {s.resolution for s in available if s.resolution}
+        qualities = sorted(resolutions, key=quality_order)
+        if available.filter(only_audio=True):
+            qualities.append(streams.AUDIO_ONLY)
+        selection = streams.select(available, self.quality_ladder)
+        # Only sizes the stream list already carries; a HEAD request per row would defeat the point
+        chosen = [s for s in (selection.video, selection.audio) if s] if selection else []
+        sizes = [metadata_cache.known_filesize(s) for s in chosen]
+        return {
+            "title": yt.title,
+            "length": yt.length,
+            "qualities": qualities,
+            "resolution": selection.resolution if selection else None,
+            "size": sum(sizes) if sizes and all(sizes) else None,
+        }
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import deque
+
+REFRESH_INTERVAL = 0.25
+
+
+def format_rate(bytes_per_second):
+    return f"{bytes_per_second / (1024 * 1024):.1f} MB/s"
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class ProgressTracker:
+    # Aggregates per-chunk byte counts from every in-flight stream. Callers report
+    # on every chunk but should only push a snapshot to the UI when should_report()
+    # says so, which caps updates at one per refresh_interval.
+    def __init__(self, refresh_interval=REFRESH_INTERVAL, window=1.0, smoothing=0.2):
+        self.refresh_interval = refresh_interval
+        self.window = window
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self.streams = {}
+        self.bytes_done = 0
+        self.finished_items = 0
+        self.finished_bytes = 0
+        self.samples = deque()
+        self.average_rate = 0.0
+        self.last_report = 0.0
+
+    def start(self, key, total, written=0, item=None):
+        with self.lock:
+            self.streams[key] = [written, total or 0, item if item is not None else key]
+
+    def advance(self, key, nbytes):
+        with self.lock:
+            self.streams[key][0] += nbytes
+            self.bytes_done += nbytes
+
+    def finish(self, item):
+        with self.lock:
+            keys = [key for key, (_, _, owner) in self.streams.items() if owner == item]
+            size = sum(self.streams[key][1] for key in keys)
+            for key in keys:
+                del self.streams[key]
+            if keys:
+                self.finished_items += 1
+                self.finished_bytes += size
+
+    def should_report(self):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_report < self.refresh_interval:
+                return False
+            self.last_report = now
+            return True
+
+    def current_rate(self, now):
+        self.samples.append((now, self.bytes_done))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        first_time, first_bytes = self.samples[0]
+        if now <= first_time:
+            return 0.0
+        return (self.bytes_done - first_bytes) / (now - first_time)
+
+    def snapshot(self, done_items, total_items):
+        with self.lock:
+            current = self.current_rate(time.monotonic())
+            self.average_rate = self.smoothing * current + (1 - self.smoothing) * self.average_rate
+            rate = self.average_rate
+
+            items = {}
+            for written, total, item in self.streams.values():
+                counts = items.setdefault(item, [0, 0])
+                counts[0] += written
+                counts[1] += total
+            in_flight = sum(written / total for written, total in items.values() if total)
+            item_eta = {item: (total - written) / rate if rate else None for item, (written, total) in items.items()}
+
+            # Items not started yet are assumed to be the size of an average finished one
+            remaining_bytes = sum(total - written for written, total in items.values())
+            if self.finished_items:
+                average_size = self.finished_bytes / self.finished_items
+            else:
+                average_size = sum(total for _, total in items.values()) / len(items) if items else 0
+            remaining_bytes += max(0, total_items - done_items - len(items)) * average_size
+
+            percent = int((done_items + in_flight) / total_items * 100) if total_items else 0
+            return {
+                "percent": min(100, percent),
+                "bytes": self.bytes_done,
+                "rate": current,
+                "average_rate": rate,
+                "eta": remaining_bytes / rate if rate else None,
+                "item_eta": item_eta,
+                "active": len(items),
+            }
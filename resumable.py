@@ -0,0 +1,156 @@
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+
+import network
+
+try:
+    # fallocate(2) itself rather than posix_fallocate, which glibc emulates by writing every
+    # block on filesystems that cannot allocate natively
+    fallocate = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).fallocate
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+except (OSError, AttributeError):  # not Linux
+    fallocate = None
+
+CHUNK_SIZE = 1024 * 1024
+# YouTube throttles open-ended ranges, so fetch in bounded segments like pytube does
+SEGMENT_SIZE = 9 * 1024 * 1024
+HEADERS = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+
+
+class IncompleteDownload(Exception):
+    pass
+
+
+def remove_if_exists(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def part_paths(output_path):
+    part_path = output_path + ".part"
+    return part_path, part_path + ".json"
+
+
+def read_sidecar(sidecar_path):
+    try:
+        with open(sidecar_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_sidecar(sidecar_path, state):
+    tmp_path = sidecar_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, sidecar_path)
+
+
+def preallocate(f, size):
+    # Reserve the whole file up front: the filesystem can lay it out in one piece, and
+    # a full disk fails here instead of halfway through the download
+    if not size or fallocate is None:
+        return
+    if fallocate(f.fileno(), 0, 0, size) != 0:
+        error = ctypes.get_errno()
+        if error == errno.ENOSPC:
+            raise OSError(error, os.strerror(error))
+        # EOPNOTSUPP and friends: the file simply grows as it is written
+
+
+def resume_offset(output_path, filesize, itag=None, video_id=None):
+    # Only trust a .part file whose sidecar describes the same stream of the same video. The
+    # sidecar's offset is only written once the bytes before it are synced, and a preallocated
+    # .part file is full length from the start, so its size alone proves nothing.
+    part_path, sidecar_path = part_paths(output_path)
+    state = read_sidecar(sidecar_path)
+    if not state or not os.path.exists(part_path):
+        return 0
+    if state.get("filesize") != filesize or state.get("itag") != itag or state.get("video_id") != video_id:
+        return 0
+    return min(state.get("offset", 0), os.path.getsize(part_path))
+
+
+def download(url, output_path, filesize, itag=None, on_progress=None, check=None,
+             pool=network.POOL, limiter=network.LIMITER, span=None, video_id=None):
+    part_path, sidecar_path = part_paths(output_path)
+    offset = resume_offset(output_path, filesize, itag, video_id)
+    if offset:
+        os.truncate(part_path, offset)
+
+    # The preallocated file is already full length, so writes go to the offset rather than the end
+    with open(part_path, "r+b" if offset else "wb") as f:
+        def checkpoint():
+            # Once per segment and when interrupted, so a crash loses at most one segment
+            with span("disk_write") if span else contextlib.nullcontext():
+                f.flush()
+                os.fsync(f.fileno())
+                write_sidecar(sidecar_path, {"url": url, "video_id": video_id, "itag": itag,
+                                             "filesize": filesize, "offset": offset})
+
+        preallocate(f, filesize)
+        f.seek(offset)
+        try:
+            while offset < filesize:
+                end = min(offset + SEGMENT_SIZE, filesize) - 1
+                with pool.request(url, headers=dict(HEADERS, Range=f"bytes={offset}-{end}")) as response:
+                    if response.status != 206:
+                        # Range not honoured: the body is the whole file, start over
+                        f.seek(0)
+                        offset = 0
+                    received = 0
+                    chunk = response.read(CHUNK_SIZE)
+                    while chunk:
+                        with span("disk_write") if span else contextlib.nullcontext():
+                            f.write(chunk)
+                        offset += len(chunk)
+                        received += len(chunk)
+                        if on_progress:
+                            on_progress(chunk, filesize - offset)
+                        limiter.consume(len(chunk), check)
+                        chunk = response.read(CHUNK_SIZE)
+                if not received:
+                    raise IncompleteDownload(f"Server returned no data at offset {offset} of {filesize}")
+                checkpoint()
+        except BaseException:
+            checkpoint()
+            raise
+        # Drop anything preallocated or sent beyond the bytes actually received
+        f.truncate(offset)
+        os.fsync(f.fileno())
+
+    if offset != filesize:
+        remove_if_exists(part_path)
+        remove_if_exists(sidecar_path)
+        raise IncompleteDownload(f"Expected {filesize} bytes, got {offset}")
+    os.replace(part_path, output_path)
+    remove_if_exists(sidecar_path)
+    return output_path
+
+
+def stream(url, filesize, write, on_progress=None, check=None, pool=network.POOL, limiter=network.LIMITER):
+    # Like download(), but every chunk goes to write() instead of a .part file. Segments
+    # continue from the last byte delivered; a failed call leaves nothing to resume from.
+    offset = 0
+    while offset < filesize:
+        end = min(offset + SEGMENT_SIZE, filesize) - 1
+        with pool.request(url, headers=dict(HEADERS, Range=f"bytes={offset}-{end}")) as response:
+            if response.status != 206 and offset:
+                raise IncompleteDownload(f"Range not honoured at offset {offset} of {filesize}")
+            received = 0
+            chunk = response.read(CHUNK_SIZE)
+            while chunk:
+                write(chunk)
+                offset += len(chunk)
+                received += len(chunk)
+                if on_progress:
+                    on_progress(chunk, filesize - offset)
+                limiter.consume(len(chunk), check)
+                chunk = response.read(CHUNK_SIZE)
+        if not received:
+            raise IncompleteDownload(f"Server returned no data at offset {offset} of {filesize}")
+    return offset
@@ -0,0 +1,60 @@
+import errno
+import http.client
+import random
+import socket
+import ssl
+import threading
+import urllib.error
+
+import resumable
+
+RETRYABLE = "retryable"
+PERMANENT = "permanent"
+
+# 403 from the stream host usually means the signed URL expired; resolving again fixes it
+RETRYABLE_STATUSES = {403, 408, 425, 429, 500, 502, 503, 504}
+# pytube's exceptions, matched by name so classifying does not import pytube
+PERMANENT_ERRORS = {
+    "VideoUnavailable", "VideoPrivate", "MembersOnly", "AgeRestrictedError", "LiveStreamError",
+    "RecordingUnavailable", "VideoRegionBlocked", "MaxRetriesExceeded",
+}
+# Network trouble worth another attempt. Other OSErrors (permissions, missing files, names
+# too long) come from the local filesystem and would fail the same way again.
+NETWORK_ERRORS = (
+    ConnectionError, TimeoutError, socket.timeout, socket.gaierror, ssl.SSLError, urllib.error.URLError,
+    http.client.HTTPException, resumable.IncompleteDownload,
+)
+# A full disk clears up once space is freed, and the next attempt waits for it before starting
+DISK_FULL = {errno.ENOSPC, errno.EDQUOT}
+
+
+def classify(error):
+    status = getattr(error, "status", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return RETRYABLE if status in RETRYABLE_STATUSES else PERMANENT
+    if any(cls.__name__ in PERMANENT_ERRORS for cls in type(error).__mro__):
+        return PERMANENT
+    if isinstance(error, NETWORK_ERRORS):
+        return RETRYABLE
+    if isinstance(error, OSError) and error.errno in DISK_FULL:
+        return RETRYABLE
+    return PERMANENT
+
+
+def backoff(attempt, base=1.0, cap=60.0):
+    # Exponential backoff with full jitter so parallel workers do not retry in lockstep
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryBudget:
+    # Caps the total number of retries in a run so a dead network does not turn into a retry storm
+    def __init__(self, retries):
+        self.remaining = retries
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
@@ -0,0 +1,91 @@
+QUALITY_LADDER = ["2160p", "1440p", "1080p", "720p", "480p", "360p", "240p", "144p"]
+AUDIO_ONLY = "audio"
+AUDIO_FORMATS = ["m4a", "opus", "mp3"]
+
+
+class Selection:
+    # In audio-only mode, video holds the single audio stream to fetch
+    def __init__(self, resolution, video, audio=None):
+        self.resolution = resolution
+        self.video = video
+        self.audio = audio
+
+    @property
+    def adaptive(self):
+        return self.audio is not None
+
+    @property
+    def filesize(self):
+        return self.video.filesize + (self.audio.filesize if self.audio else 0)
+
+
+class StreamList(list):
+    # The part of pytube's StreamQuery this module uses, for streams that did not come
+    # from pytube (cached metadata, the benchmark server)
+    def filter(self, progressive=None, adaptive=None, only_video=None, only_audio=None, res=None,
+               file_extension=None):
+        return StreamList(
+            s for s in self
+            if (progressive is None or s.is_progressive == progressive)
+            and (adaptive is None or s.is_adaptive == adaptive)
+            and (not only_video or (s.includes_video_track and not s.includes_audio_track))
+            and (not only_audio or (s.includes_audio_track and not s.includes_video_track))
+            and (res is None or s.resolution == res)
+            and (file_extension is None or s.subtype == file_extension)
+        )
+
+    def first(self):
+        return self[0] if self else None
+
+
+def fallback_ladder(quality, fallback=True):
+    if not fallback or quality not in QUALITY_LADDER:
+        return [quality]
+    return QUALITY_LADDER[QUALITY_LADDER.index(quality):]
+
+
+def best_video(streams, resolution):
+    # H.264 first so the post-processing probe can usually skip or remux, then highest bitrate
+    candidates = streams.filter(adaptive=True, only_video=True, res=resolution, file_extension='mp4')
+    return max(
+        candidates,
+        key=lambda s: ((s.video_codec or "").startswith("avc1"), s.bitrate or 0),
+        default=None
+    )
+
+
+def best_audio(streams):
+    candidates = streams.filter(adaptive=True, only_audio=True, file_extension='mp4')
+    return max(candidates, key=lambda s: s.bitrate or 0, default=None)
+
+
+def best_audio_for(streams, audio_format):
+    # Prefer the codec the target format can take without re-encoding: opus for .opus,
+    # AAC for .m4a; mp3 is always encoded, so take the best source
+    candidates = streams.filter(only_audio=True)
+    wanted = {"opus": "opus", "m4a": "mp4a"}.get(audio_format)
+    return max(
+        candidates,
+        key=lambda s: (bool(wanted) and (s.audio_codec or "").startswith(wanted), s.bitrate or 0),
+        default=None
+    )
+
+
+def select(streams, ladder, audio_format=AUDIO_FORMATS[0]):
+    if ladder == [AUDIO_ONLY]:
+        audio = best_audio_for(streams, audio_format)
+        return Selection(AUDIO_ONLY, audio) if audio else None
+
+    # Walk the ladder from the requested quality down. A progressive stream at a given
+    # resolution needs no mux, so it wins over an adaptive pair of the same resolution.
+    audio = None
+    for resolution in ladder:
+        progressive = streams.filter(progressive=True, res=resolution, file_extension='mp4').first()
+        if progressive:
+            return Selection(resolution, progressive)
+        video = best_video(streams, resolution)
+        if video:
+            audio = audio or best_audio(streams)
+            if audio:
+                return Selection(resolution, video, audio)
+    return None